@@ -4,6 +4,7 @@ import time
 from Analysis import TupleReader
 from Analysis import HistManager
 from Analysis import EventCounter
+from Analysis import Kernels
 
 #======================================================================
 
@@ -18,6 +19,13 @@ class Analysis(object):
         self.Name         = type(self).__name__
         self.TotName      = auxName + "." + self.Name
         self.isData       = False
+        # Staged reading: if branches are listed here, only they (and the branches of the event weight) are read for
+        # every event, all other branches only for events passing preselect(), which may only use the listed branches
+        self.Stage1Branches = []
+        # set by the Job if the "all" count was already taken before the event loop (see the Preselection setting)
+        self.PreCounted = False
+        # compiled kernel libraries are kept here, set by the Job to <CacheDirectory>/kernels
+        self.KernelDirectory = "Cache/kernels"
 
         # Functionality providers
         self.Store        = TupleReader.TupleReader()
@@ -33,29 +41,49 @@ class Analysis(object):
 
     #Execution functions
     def doInitialization(self):
+        self.declareDerived("weight", self.computeEventWeight)
         self.initialize()
+        if self.Stage1Branches:
+            self.Stage1Branches = list(self.Stage1Branches) + ([] if self.getIsData() else self.Store.weightBranches)
+            self.Store.activateBranches(self.Stage1Branches)
       
     def initialize(self):
         pass
         
+    # Returns whether the event passed the preselection, these events are kept in skims
     def doAnalysis(self):
-        eventinfo = self.Store.getEventInfo()
-        weight = eventinfo.scalefactor()*eventinfo.eventWeight() if not self.getIsData() else 1
-        self.countEvent("all", weight)
+        weight = self.eventWeight()
+        if not self.PreCounted:
+            self.countEvent("all", weight)
+        if not self.preselect(): return False
+        self.Store.completeEntry()
         if self.analyze():
             self.countEvent("final", weight)
+        return True
         
+    def preselect(self):
+        return True
+
     def analyze(self):
         return True
     
     def doFinalization(self):
         self.HistManager.writeHistograms()
+        self.EventCounter.writeResults()
         self.EventCounter.printResults()
         self.finalize()
 
     def finalize(self):
         pass
 
+    # Event weight, computed once per event
+    def eventWeight(self):
+        return self.Store.derived("weight")
+
+    def computeEventWeight(self):
+        eventinfo = self.Store.getEventInfo()
+        return eventinfo.scalefactor()*eventinfo.eventWeight() if not self.getIsData() else 1
+
     #Forwarding functions
     def addHistogram(self, histName, histogram):
         return self.HistManager.addHistogram(histName, histogram)
@@ -66,5 +94,14 @@ class Analysis(object):
     def getHistogram(self, histName):
         return self.HistManager.getHistogram(histName)
   
+    def declareKernels(self, name, source):
+        return Kernels.load(name, source, self.KernelDirectory)
+
+    def declareDerived(self, name, function):
+        self.Store.declareDerived(name, function)
+
+    def derived(self, name):
+        return self.Store.derived(name)
+
     def countEvent(self, cut, weight):
         self.EventCounter.update(cut, weight)
@@ -65,5 +65,18 @@ def StandardEventCuts(eventinfo):
     
     
 # Variable Definitions:
+# These work on single objects with math, which is much faster than numpy for a few values. The same quantities on arrays
+# are found in Kinematics.py and follow the same conventions.
 def WTransverseMass(lepton, etmiss):
-    return math.sqrt(2*lepton.pt()*etmiss.et()*(1-math.cos(lepton.tlv().DeltaPhi(etmiss.tlv()))));
+    deltaPhi = (lepton.phi() - etmiss.phi() + math.pi) % (2*math.pi) - math.pi
+    return math.sqrt(2*lepton.pt()*etmiss.et()*(1 - math.cos(deltaPhi)))
+
+def InvariantMass(particles):
+    px, py, pz, e = 0., 0., 0., 0.
+    for p in particles:
+        px += p.pt()*math.cos(p.phi())
+        py += p.pt()*math.sin(p.phi())
+        pz += p.pt()*math.sinh(p.eta())
+        e  += p.e()
+    mm = e*e - (px*px + py*py + pz*pz)
+    return -math.sqrt(-mm) if mm < 0 else math.sqrt(mm)
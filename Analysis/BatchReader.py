@@ -0,0 +1,214 @@
+"""The BatchReader implements a columnar readout of the ROOT tuples as an alternative to the event by event
+readout of the TupleReader. Whole clusters of the TTree are read at once for all activated branches and are
+handed to the analysis as a Batch of numpy arrays:
+    scalar branches (mcWeight, trigE, ...)      : one value per event
+    collection branches (lep_pt, jet_eta, ...)  : flat array of all values plus the offsets delimiting the events
+"""
+
+import ROOT
+import numpy
+
+# numpy types corresponding to the type codes used in TupleReader.activate
+dtypes = {"f" : numpy.float32, "i" : numpy.int32, "b" : numpy.bool_}
+
+# TTree::Draw can evaluate at most four expressions in one pass
+maxColumnsPerDraw = 4
+
+#======================================================================
+
+class BatchReader(object):
+    """Reads the branches activated in a TupleReader in batches of whole TTree clusters.
+    Collection branches are identified by their multiplicity branch (lep_pt -> lep_n), which is always read
+    together with them to build the offsets.
+    """
+    def __init__(self, store, columnCache = None):
+        super(BatchReader, self).__init__()
+        self.Store       = store
+        self.Tree        = store.Tree
+        self.Counters    = {}
+        # columns are taken from the converted copies of the input files if a ColumnCache is given
+        self.ColumnCache = columnCache
+
+    # Batch boundaries
+    def clusterRanges(self, first, last, minSize = 1):
+        """Splits [first, last) into ranges of consecutive clusters holding at least minSize entries.
+        Ranges never extend over the boundary between two files of a TChain."""
+        ranges = []
+        start  = first
+        entry  = first
+        while entry < last:
+            local = self.Tree.LoadTree(entry)
+            if local < 0: break
+            offset   = entry - local
+            clusters = self.Tree.GetTree().GetClusterIterator(local)
+            clusters.Next()
+            entry = min(offset + clusters.GetNextEntry(), last)
+            if entry - start >= minSize or entry == last or entry == offset + self.Tree.GetTree().GetEntries():
+                ranges.append((start, entry))
+                start = entry
+        return ranges
+
+    def batches(self, first, last, minSize = 1):
+        for start, end in self.clusterRanges(first, last, minSize):
+            yield self.readBatch(start, end)
+
+    # Readout
+    def readBatch(self, first, last):
+        """Reads all branches activated so far. Further branches are read on demand when the analysis accesses them."""
+        batch = Batch(first, last, self)
+        self.readColumns(batch, list(self.Store.Activated))
+        return batch
+
+    def readColumns(self, batch, branchnames):
+        if self.ColumnCache is not None:
+            return self.readCachedColumns(batch, branchnames)
+        scalars, collections = self.groupBranches(branchnames)
+
+        for names in chunks([name for name in scalars if name not in batch.Columns], maxColumnsPerDraw):
+            for name, values in zip(names, self.draw(names, batch.First, batch.Last, batch.Size)):
+                batch.Columns[name] = values.astype(dtypes[self.Store.Activated[name]])
+
+        for counter, names in collections.items():
+            if counter not in self.Store.Activated:
+                self.Store.activateBranches([counter])
+            if counter not in batch.Offsets:
+                self.readColumns(batch, [counter])
+                batch.Offsets[counter] = numpy.concatenate(([0], numpy.cumsum(batch.Columns[counter], dtype=numpy.int64)))
+            for chunk in chunks([name for name in names if name not in batch.Columns], maxColumnsPerDraw):
+                for name, values in zip(chunk, self.draw(chunk, batch.First, batch.Last, int(batch.Offsets[counter][-1]))):
+                    batch.Columns[name] = values.astype(dtypes[self.Store.Activated[name]])
+
+    # The cached columns are read-only views of the memory mapped files
+    def readCachedColumns(self, batch, branchnames):
+        scalars, collections = self.groupBranches(branchnames)
+        for name in scalars:
+            if name not in batch.Columns:
+                batch.Columns[name] = self.ColumnCache.values(name, self.Store.Activated[name], batch.First, batch.Last)
+        for counter, names in collections.items():
+            if counter not in self.Store.Activated:
+                self.Store.activateBranches([counter])
+            if counter not in batch.Offsets:
+                batch.Columns[counter] = self.ColumnCache.values(counter, self.Store.Activated[counter], batch.First, batch.Last)
+                batch.Offsets[counter] = self.ColumnCache.offsets(counter, batch.First, batch.Last)
+            for name in names:
+                if name not in batch.Columns:
+                    batch.Columns[name] = self.ColumnCache.collection(name, self.Store.Activated[name], counter, batch.First, batch.Last)
+
+    # Called by the batch for branches that were not activated yet
+    def readColumn(self, batch, branchname):
+        self.Store.activateBranches([branchname])
+        if branchname not in self.Store.Activated:
+            raise KeyError("Branch " + branchname + " is not declared in the TupleReader")
+        self.readColumns(batch, [branchname])
+        return batch.Columns[branchname]
+
+    def draw(self, branchnames, first, last, nrows):
+        return drawColumns(self.Tree, branchnames, first, last, nrows)
+
+    # Helper functions
+    def groupBranches(self, branches):
+        scalars     = []
+        collections = {}
+        for name in branches:
+            counter = self.counterBranch(name)
+            if counter is None:
+                scalars.append(name)
+            else:
+                collections.setdefault(counter, []).append(name)
+        return scalars, collections
+
+    def counterBranch(self, branchname):
+        """Returns the multiplicity branch of a collection branch (lep_pt -> lep_n), None for scalar branches."""
+        if branchname not in self.Counters:
+            counter = branchname.split("_")[0] + "_n"
+            if counter == branchname or not self.Tree.GetBranch(counter):
+                counter = None
+            self.Counters[branchname] = counter
+        return self.Counters[branchname]
+
+#======================================================================
+
+class Batch(object):
+    """A Batch holds the entries [First, Last) of the tuple as numpy arrays, indexed by branch name.
+    Values of collection branches are stored flat, the values of event i are found in
+    values[offsets[i]:offsets[i+1]].
+    """
+    def __init__(self, first, last, reader):
+        super(Batch, self).__init__()
+        self.Reader  = reader
+        self.First   = first
+        self.Last    = last
+        self.Size    = last - first
+        self.Columns = {}
+        self.Offsets = {}
+        self.Derived = {}
+
+    def __getitem__(self, branchname):
+        if branchname not in self.Columns:
+            return self.Reader.readColumn(self, branchname)
+        return self.Columns[branchname]
+
+    def __contains__(self, branchname):
+        return branchname in self.Columns
+
+    def __len__(self):
+        return self.Size
+
+    def isCollection(self, branchname):
+        return self.Reader.counterBranch(branchname) is not None
+
+    def counterName(self, branchname):
+        return branchname.split("_")[0] + "_n"
+
+    def offsets(self, branchname):
+        if self.counterName(branchname) not in self.Offsets:
+            self[branchname]
+        return self.Offsets[self.counterName(branchname)]
+
+    def counts(self, branchname):
+        return numpy.diff(self.offsets(branchname))
+
+    def eventIndex(self, branchname):
+        """Index of the event each value of a collection branch belongs to."""
+        return numpy.repeat(numpy.arange(self.Size), self.counts(branchname))
+
+    def localIndex(self, branchname):
+        """Position of each value of a collection branch within its event."""
+        offsets = self.offsets(branchname)
+        return numpy.arange(offsets[-1]) - numpy.repeat(offsets[:-1], numpy.diff(offsets))
+
+    def padded(self, branchname, width, fill = 0):
+        """Returns a (Size, width) array of a collection branch, truncated or padded with fill as needed."""
+        values = self[branchname]
+        local  = self.localIndex(branchname)
+        keep   = local < width
+        result = numpy.full((self.Size, width), fill, dtype=values.dtype)
+        result[self.eventIndex(branchname)[keep], local[keep]] = values[keep]
+        return result
+
+#======================================================================
+
+def alignToCluster(tree, entry):
+    """Returns the first entry of the first cluster starting at or after the given entry."""
+    local = tree.LoadTree(entry)
+    clusters = tree.GetTree().GetClusterIterator(local)
+    if clusters.Next() == local:
+        return entry
+    return entry - local + clusters.GetNextEntry()
+
+def drawColumns(tree, branchnames, first, last, nrows):
+    """Evaluates up to four branches with the same multiplicity for the entries [first, last)
+    and returns copies of the resulting value buffers."""
+    tree.SetEstimate(nrows + 1)
+    if tree.Draw(":".join(branchnames), "", "goff", last - first, first) < 0:
+        raise RuntimeError("Could not read branches " + ", ".join(branchnames))
+    nrows = tree.GetSelectedRows()
+    columns = []
+    for i in range(len(branchnames)):
+        values = tree.GetVal(i)
+        if nrows > 0: values.reshape((nrows,))
+        columns.append(numpy.array(values, dtype=numpy.float64) if nrows > 0 else numpy.zeros(0))
+    return columns
+
+def chunks(items, size):
+    return [items[i:i+size] for i in range(0, len(items), size)]
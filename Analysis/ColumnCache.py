@@ -0,0 +1,124 @@
+"""Columnar copies of the branches of the input files, as an alternative to reading them from the ROOT files in every run.
+Every branch of an input file is converted once into an uncompressed .npy file in the cache directory:
+    scalar branches (mcWeight, trigE, ...)      : one value per entry
+    collection branches (lep_pt, jet_eta, ...)  : flat array of all values, the multiplicity branch (lep_n) is stored
+                                                  together with the offsets delimiting the entries (lep_n.offsets.npy)
+Later runs open the files with numpy.memmap, so no ROOT decompression is needed and the pages are shared between the
+workers of a pool through the page cache of the operating system. The columns of an input file are kept in a directory
+named after its location and belong to the recorded size and modification time, if the file changes they are converted anew.
+"""
+
+import bisect
+import hashlib
+import json
+import numpy
+import os
+import shutil
+
+from Analysis import BatchReader
+from Analysis import FileCache
+
+# number of entries converted per TTree::Draw call
+entriesPerStep = 1000000
+
+#======================================================================
+
+class ColumnCache(object):
+    """Columns of the input files of a job, addressed by the entry numbers of the TChain of the job.
+    Ranges of entries are served as read-only slices of the memory mapped files and must not extend over two input files,
+    which holds for the batches of the BatchReader."""
+    def __init__(self, metadata, directory):
+        super(ColumnCache, self).__init__()
+        self.Files  = [ColumnFile(fileMetadata, directory) for fileMetadata in metadata]
+        self.Starts = list(numpy.cumsum([0] + [fileMetadata.entries() for fileMetadata in metadata]))
+
+    def locate(self, first, last):
+        index = bisect.bisect_right(self.Starts, first) - 1
+        if last > self.Starts[index + 1]:
+            raise ValueError("Entries %d to %d extend over two input files" % (first, last))
+        return self.Files[index], first - self.Starts[index], last - self.Starts[index]
+
+    def values(self, branchname, vartype, first, last):
+        columnFile, first, last = self.locate(first, last)
+        return columnFile.column(branchname, vartype)[first:last]
+
+    def offsets(self, counter, first, last):
+        """Offsets delimiting the entries [first, last) in the values of their collection, starting at 0."""
+        columnFile, first, last = self.locate(first, last)
+        offsets = columnFile.offsets(counter)[first:last + 1]
+        return offsets - offsets[0]
+
+    def collection(self, branchname, vartype, counter, first, last):
+        """Flat values of a collection branch for the entries [first, last)."""
+        columnFile, first, last = self.locate(first, last)
+        offsets = columnFile.offsets(counter)
+        return columnFile.column(branchname, vartype, counter)[offsets[first]:offsets[last]]
+
+#======================================================================
+
+class ColumnFile(object):
+    """The converted columns of a single input file."""
+    def __init__(self, metadata, directory):
+        super(ColumnFile, self).__init__()
+        self.Metadata  = metadata
+        key            = hashlib.sha1(metadata.Identity["path"].encode()).hexdigest()
+        self.Directory = os.path.join(directory, key)
+        self.Lock      = os.path.join(directory, key + ".lock")
+        self.Columns   = {}
+        os.makedirs(directory, exist_ok=True)
+        with FileCache.FileLock(self.Lock):
+            self.validate()
+
+    # Columns of an earlier version of the input file are removed
+    def validate(self):
+        identityLocation = os.path.join(self.Directory, "identity.json")
+        if os.path.exists(identityLocation):
+            with open(identityLocation) as identityFile:
+                if json.load(identityFile) == self.Metadata.Identity:
+                    return
+            shutil.rmtree(self.Directory)
+        os.makedirs(self.Directory, exist_ok=True)
+        with open(identityLocation, "w") as identityFile:
+            json.dump(self.Metadata.Identity, identityFile)
+
+    def location(self, name):
+        return os.path.join(self.Directory, name + ".npy")
+
+    def column(self, branchname, vartype, counter = None):
+        if branchname not in self.Columns:
+            if not os.path.exists(self.location(branchname)):
+                # the offsets are converted first, the lock is not reentrant
+                offsets = self.offsets(counter) if counter else None
+                with FileCache.FileLock(self.Lock):
+                    if not os.path.exists(self.location(branchname)):
+                        self.convert(branchname, vartype, offsets)
+            self.Columns[branchname] = numpy.load(self.location(branchname), mmap_mode="r")
+        return self.Columns[branchname]
+
+    def offsets(self, counter):
+        name = counter + ".offsets"
+        if name not in self.Columns:
+            if not os.path.exists(self.location(name)):
+                counts = self.column(counter, "i")
+                self.write(name, numpy.concatenate(([0], numpy.cumsum(counts, dtype=numpy.int64))))
+            self.Columns[name] = numpy.load(self.location(name), mmap_mode="r")
+        return self.Columns[name]
+
+    # Conversion
+    def convert(self, branchname, vartype, offsets):
+        tree    = self.Metadata.tree()
+        entries = self.Metadata.entries()
+        if offsets is None:
+            offsets = numpy.arange(entries + 1)
+        column  = numpy.empty(int(offsets[-1]), dtype=BatchReader.dtypes[vartype])
+        for first in range(0, entries, entriesPerStep):
+            last = min(first + entriesPerStep, entries)
+            begin, end = int(offsets[first]), int(offsets[last])
+            if end > begin:
+                column[begin:end] = BatchReader.drawColumns(tree, [branchname], first, last, end - begin)[0]
+        self.write(branchname, column)
+
+    def write(self, name, values):
+        temporary = self.location(name) + ".%d.tmp.npy" % os.getpid()
+        numpy.save(temporary, values)
+        os.replace(temporary, self.location(name))
@@ -0,0 +1,76 @@
+import ROOT
+import time
+
+#======================================================================
+
+class DataFrameEngine(object):
+    """Runs a DeclarativeAnalysis as a ROOT.RDataFrame graph over the input tree, with implicit multithreading.
+    All histograms and the sums of the cutflow are booked before a single event loop is started. The counts of the
+    named filters are taken from the cutflow report of the data frame, the sums of weights from sums booked after every
+    filter. At the end the results are added to the histograms of the HistManager and to the EventCounter, so the output
+    file is written as for any other analysis.
+    """
+    def __init__(self, analysis, treeName, files):
+        super(DataFrameEngine, self).__init__()
+        self.Analysis = analysis
+        # the data frame reads the files itself, independent of the TChain of the job and the TupleReader
+        self.TreeName = treeName
+        self.Files    = files
+        self.Frame    = None
+
+    def run(self, first, last, entries, threads = 0, preselection = ""):
+        """Processes the entries [first, last) of the entries of the files. Implicit multithreading is switched on or off
+        for the data frame and set back to its previous state afterwards."""
+        enabled, poolSize = ROOT.IsImplicitMTEnabled(), ROOT.GetThreadPoolSize()
+        try:
+            self.execute(self.dataFrame(first, last, entries, threads), preselection)
+        finally:
+            self.Frame = None
+            if enabled:
+                ROOT.EnableImplicitMT(poolSize)
+            else:
+                ROOT.DisableImplicitMT()
+
+    def execute(self, node, preselection):
+        node = node.Define("weight", self.Analysis.weightDefinition()).Define("weight2", "weight*weight")
+        # the "all" count may have been taken before, e.g. from a skim
+        counters, histograms = [] if self.Analysis.PreCounted else [("all", node)], []
+        if preselection:
+            node = node.Filter(preselection)
+        for step in self.Analysis.Steps:
+            if step[0] == "define":
+                node = node.Define(step[1], step[2])
+            elif step[0] == "filter":
+                node = node.Filter(step[1], step[2] or "")
+                if step[2]: counters.append((step[2], node))
+            elif step[0] == "fill":
+                histogram, column, weight = step[1:]
+                histograms.append((histogram, node.Histo1D(ROOT.RDF.TH1DModel(histogram), column, weight)))
+        counters.append(("final", node))
+        sums   = [(cut, n.Count(), n.Sum("weight"), n.Sum("weight2")) for cut, n in counters]
+        report = node.Report()
+
+        start = time.time()
+        cutflow = report.GetValue()
+        self.log("Event loop took %.1fs" % (time.time() - start))
+        for cut, count, sumOfWeights, sumOfSquaredWeights in sums:
+            passed = count.GetValue() if cut in ["all", "final"] else cutflow.At(cut).GetPass()
+            self.Analysis.EventCounter.updateSums(cut, int(passed), sumOfWeights.GetValue(), sumOfSquaredWeights.GetValue())
+        for histogram, result in histograms:
+            histogram.Add(result.GetPtr())
+
+    def dataFrame(self, first, last, entries, threads):
+        if first == 0 and last >= entries:
+            # threads = 0 uses all cores
+            ROOT.EnableImplicitMT(threads)
+            self.Frame = ROOT.RDataFrame(self.TreeName, self.Files)
+            self.log("Running on %d threads" % ROOT.GetThreadPoolSize())
+            return self.Frame
+        # a range of entries can only be processed by a single thread
+        ROOT.DisableImplicitMT()
+        self.Frame = ROOT.RDataFrame(self.TreeName, self.Files)
+        self.log("Running on a single thread for entries %d to %d" % (first, last))
+        return self.Frame.Range(first, last)
+
+    def log(self, message):
+        print(time.ctime() + " DataFrameEngine: " + message)
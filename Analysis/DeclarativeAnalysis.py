@@ -0,0 +1,46 @@
+import ROOT
+import re
+
+from Analysis import Analysis
+from Analysis import TupleReader
+
+#======================================================================
+
+class DeclarativeAnalysis(Analysis.Analysis):
+    """Baseclass for analyses that describe their selection instead of implementing an event loop.
+    In initialize they define new columns, apply filters and fill histograms, in the order these steps are applied,
+    using C++ expressions of the branches of the tree and of the columns defined before. The column "weight" holds
+    the event weight. Filters given a cut name are counted in the cutflow, events passing all filters as "final".
+    The Job runs the description as a ROOT.RDataFrame graph on all cores (see DataFrameEngine.py).
+    """
+
+    def __init__(self, auxName):
+        super(DeclarativeAnalysis, self).__init__(auxName)
+        self.Steps = []
+
+    #Execution functions
+    def doInitialization(self):
+        # the histograms are filled by the data frame and only added up at the end
+        self.HistManager.BufferSize = 0
+        self.HistManager.Backend    = "root"
+        self.initialize()
+
+    # Event weight as a C++ expression, the same product as EventInfo.scalefactor()*EventInfo.eventWeight() in double precision
+    def weightDefinition(self):
+        if self.getIsData():
+            return "1.0"
+        expression = TupleReader.TupleReader.weightExpression
+        for branch in TupleReader.TupleReader.weightBranches:
+            expression = re.sub(r"\b%s\b" % branch, "double(%s)" % branch, expression)
+        return expression
+
+    #Declaration functions
+    def define(self, name, expression):
+        self.Steps.append(("define", name, expression))
+
+    def filter(self, expression, cut = None):
+        self.Steps.append(("filter", expression, cut))
+
+    # Histograms have to be TH1D, columns holding collections are filled element by element with a weight column of the same size
+    def fill(self, histogram, column, weight = "weight"):
+        self.Steps.append(("fill", histogram, column, weight))
@@ -1,7 +1,12 @@
 import ROOT
 import collections
+import math
 import time
 
+# names of the cutflow histograms in the output files
+cutflowName    = "cutflow"
+rawCutflowName = "cutflow_raw"
+
 #======================================================================
 
 class EventCounter(object):
@@ -11,6 +16,7 @@ class EventCounter(object):
         self.Name = name
         self.RawCounter      = collections.Counter()
         self.WeightedCounter = collections.Counter()
+        self.SquaredWeightCounter = collections.Counter()
     
     def printResults(self):
         self.log("+----------------------------------------------------------------+")
@@ -25,5 +31,71 @@ class EventCounter(object):
     def update(self, cut, weight):
         self.RawCounter.update([cut])
         self.WeightedCounter[cut] += weight
+        self.SquaredWeightCounter[cut] += weight*weight
+
+    def updateBatch(self, cut, weights):
+        self.RawCounter[cut]      += len(weights)
+        self.WeightedCounter[cut] += float(weights.sum())
+        self.SquaredWeightCounter[cut] += float((weights*weights).sum())
+
+    # Adds events counted outside of the event loop, e.g. in a pass over the event weights only
+    def updateSums(self, cut, count, sumOfWeights, sumOfSquaredWeights):
+        self.RawCounter[cut]           += count
+        self.WeightedCounter[cut]      += sumOfWeights
+        self.SquaredWeightCounter[cut] += sumOfSquaredWeights
+
+    # Adds the counts of another event counter, e.g. of a job processing a different part of the same sample
+    def add(self, other):
+        self.RawCounter.update(other.RawCounter)
+        self.WeightedCounter.update(other.WeightedCounter)
+        self.SquaredWeightCounter.update(other.SquaredWeightCounter)
+
+    # The cutflow is stored in the output file as two histograms with one bin per cut, in the order the cuts were first passed:
+    #   cutflow     : sum of weights, the bin errors hold the square root of the sum of squared weights
+    #   cutflow_raw : number of events
+    def writeResults(self):
+        cuts = list(self.RawCounter)
+        if not cuts: return
+        cutflowHistogram(cutflowName, "weighted cutflow", cuts, [self.WeightedCounter[cut] for cut in cuts], [self.SquaredWeightCounter[cut] for cut in cuts]).Write()
+        cutflowHistogram(rawCutflowName, "cutflow", cuts, [self.RawCounter[cut] for cut in cuts], [self.RawCounter[cut] for cut in cuts]).Write()
+
+    def readResults(self, directory):
+        """Adds the cutflow stored in a file (or any other ROOT directory) to the counters."""
+        weighted = readCutflow(directory.Get(cutflowName))
+        raw      = readCutflow(directory.Get(rawCutflowName))
+        for cut in raw:
+            self.RawCounter[cut]           += int(round(raw[cut][0]))
+            self.WeightedCounter[cut]      += weighted[cut][0]
+            self.SquaredWeightCounter[cut] += weighted[cut][1]
+
+#======================================================================
+
+def cutflowHistogram(name, title, cuts, values, squaredErrors):
+    """Histogram with one labelled bin per cut. It is not attached to any directory."""
+    histogram = ROOT.TH1D(name, title, len(cuts), 0, len(cuts))
+    histogram.SetDirectory(ROOT.nullptr)
+    histogram.Sumw2()
+    for i, cut in enumerate(cuts):
+        histogram.GetXaxis().SetBinLabel(i + 1, cut)
+        histogram.SetBinContent(i + 1, values[i])
+        histogram.SetBinError(i + 1, math.sqrt(squaredErrors[i]))
+    return histogram
+
+def readCutflow(histogram):
+    """Returns an ordered dictionary of cut -> (value, squared error) of a cutflow histogram."""
+    cutflow = collections.OrderedDict()
+    if not histogram: return cutflow
+    for i in range(1, histogram.GetNbinsX() + 1):
+        cutflow[histogram.GetXaxis().GetBinLabel(i)] = (histogram.GetBinContent(i), histogram.GetBinError(i)**2)
+    return cutflow
+
+def addCutflows(first, second):
+    """Adds two cutflow histograms bin by bin according to their labels. Cuts that only appear in the second one are appended."""
+    cutflow = readCutflow(first)
+    for cut, (value, squaredError) in readCutflow(second).items():
+        previous = cutflow.get(cut, (0., 0.))
+        cutflow[cut] = (previous[0] + value, previous[1] + squaredError)
+    cuts = list(cutflow)
+    return cutflowHistogram(first.GetName(), first.GetTitle(), cuts, [cutflow[cut][0] for cut in cuts], [cutflow[cut][1] for cut in cuts])
         
         
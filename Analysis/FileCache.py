@@ -0,0 +1,268 @@
+"""Local on-disk cache for input files that are read from a remote server.
+A remote file is downloaded once, checked against the size announced by the server and stored under the sha256
+checksum of its content (content addressed). An index maps the remote location to the checksum of its content and to the
+identity of the remote file (see FileMetadata.fileIdentity) it was downloaded from, it is downloaded again once this changes.
+The total size of the cache is limited, the least recently used files are evicted first.
+Concurrent requests for the same file, e.g. from several workers of a pool, are serialised with file locks,
+so every file is only downloaded once. Files are protected by a shared lock while they are read and are not evicted
+before every reader released them.
+"""
+
+import ROOT
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+
+from Analysis import FileMetadata
+
+# size of the blocks in which files are downloaded and checksummed
+blockSize = 1 << 20
+
+#======================================================================
+
+class FileCache(object):
+    """Content addressed cache of remote input files, located in a directory with the subdirectories
+        index   : one json file per remote location with the checksum and size of its content and the identity of the remote file
+        objects : the cached files, named after their checksum
+        locks   : lock files used to coordinate concurrent downloads, reads and evictions
+    """
+    def __init__(self, directory, sizeLimit, verifyChecksum = False):
+        super(FileCache, self).__init__()
+        self.Directory      = directory
+        self.SizeLimit      = sizeLimit
+        self.VerifyChecksum = verifyChecksum
+        self.ReadLocks      = {}
+        for subdirectory in ["index", "objects", "locks"]:
+            os.makedirs(os.path.join(self.Directory, subdirectory), exist_ok=True)
+
+    def localCopy(self, location, identity = None):
+        """Returns the location of a local copy of an input file. Local files are returned unchanged.
+        identity is the current identity of the remote file, it is asked from the server if not given.
+        The copy is protected from eviction until it is released."""
+        if not FileMetadata.isRemote(location):
+            return location
+        identity = identity or FileMetadata.fileIdentity(location)
+        with FileLock(self.lockLocation(location)):
+            path = self.lookup(location, identity)
+            if path is not None:
+                self.protect(path)
+                # evicted before the lock was taken
+                if not os.path.exists(path):
+                    self.release(path)
+                    path = None
+            if path is None:
+                path = self.fetch(location, identity)
+            # the modification time of the cached files is used to determine the least recently used ones
+            os.utime(path, None)
+        self.evict()
+        return path
+
+    def release(self, path):
+        """Allows the eviction of a copy returned by localCopy once it is no longer read."""
+        if path in self.ReadLocks:
+            self.ReadLocks.pop(path).__exit__()
+
+    def releaseAll(self):
+        [self.release(path) for path in list(self.ReadLocks)]
+
+    def protect(self, path):
+        if path not in self.ReadLocks:
+            self.ReadLocks[path] = FileLock(self.readLockLocation(path), shared=True).__enter__()
+
+    # Cache lookup and filling
+    def lookup(self, location, identity):
+        entry = self.readIndex(location)
+        if entry is None: return None
+        if entry.get("identity") != identity:
+            self.log("Remote file %s changed since it was cached" % location)
+            return None
+        path = self.objectLocation(entry["sha256"])
+        if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+            return None
+        if self.VerifyChecksum and fileChecksum(path) != entry["sha256"]:
+            self.log("Checksum mismatch for cached copy of " + location)
+            return None
+        return path
+
+    def fetch(self, location, identity):
+        self.log("Downloading " + location)
+        start     = time.time()
+        temporary = os.path.join(self.Directory, "objects", "%s.%d.download" % (self.key(location), os.getpid()))
+        try:
+            checksum, size = download(location, temporary)
+        except Exception:
+            if os.path.exists(temporary): os.remove(temporary)
+            raise
+        path = self.objectLocation(checksum)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.protect(path)
+        os.replace(temporary, path)
+        self.writeIndex(location, {"location" : location, "sha256" : checksum, "size" : size, "identity" : identity})
+        self.log("Stored %.1f MB in %4.0fs as %s" % (size/1e6, time.time() - start, path))
+        return path
+
+    def evict(self):
+        """Removes the least recently used files until the cache fits into its size limit. Files that are being read
+        by any process are skipped."""
+        with FileLock(os.path.join(self.Directory, "locks", "eviction.lock")):
+            objects = []
+            for root, directories, files in os.walk(os.path.join(self.Directory, "objects")):
+                objects += [os.path.join(root, name) for name in files if name.endswith(".root")]
+            objects = sorted([(os.path.getmtime(path), os.path.getsize(path), path) for path in objects])
+            total = sum([size for usage, size, path in objects])
+            for usage, size, path in objects:
+                if total <= self.SizeLimit: break
+                with FileLock(self.readLockLocation(path), blocking=False) as lock:
+                    if not lock.Locked: continue
+                    os.remove(path)
+                total -= size
+                self.log("Evicted " + path)
+            if total > self.SizeLimit:
+                self.log("Cache holds %.1f MB of files in use, above the limit of %.1f MB" % (total/1e6, self.SizeLimit/1e6))
+
+    # Index handling
+    def readIndex(self, location):
+        if not os.path.exists(self.indexLocation(location)): return None
+        with open(self.indexLocation(location)) as index:
+            return json.load(index)
+
+    def writeIndex(self, location, entry):
+        temporary = self.indexLocation(location) + ".%d.tmp" % os.getpid()
+        with open(temporary, "w") as index:
+            json.dump(entry, index, indent=1, sort_keys=True)
+        os.replace(temporary, self.indexLocation(location))
+
+    # Helper functions
+    def key(self, location):
+        return hashlib.sha1(location.encode()).hexdigest()
+
+    def indexLocation(self, location):
+        return os.path.join(self.Directory, "index", self.key(location) + ".json")
+
+    def lockLocation(self, location):
+        return os.path.join(self.Directory, "locks", self.key(location) + ".lock")
+
+    def readLockLocation(self, path):
+        return os.path.join(self.Directory, "locks", os.path.basename(path) + ".lock")
+
+    def objectLocation(self, checksum):
+        return os.path.join(self.Directory, "objects", checksum[:2], checksum + ".root")
+
+    def log(self, message):
+        print(time.ctime() + " FileCache: " + message)
+
+#======================================================================
+
+class Prefetcher(threading.Thread):
+    """Downloads the remote input files of upcoming jobs into the file cache in a background thread while the current
+    jobs are being processed. Files count as in flight from their download until their job is released, a file is only
+    downloaded if it fits next to the files in flight into maxInFlight bytes, which is at most the size limit of the cache.
+    """
+    def __init__(self, fileCache, locations, maxInFlight):
+        super(Prefetcher, self).__init__()
+        self.daemon      = True
+        self.FileCache   = fileCache
+        self.Locations   = [location for location in locations if FileMetadata.isRemote(location)]
+        self.MaxInFlight = min(maxInFlight, fileCache.SizeLimit)
+        self.InFlight    = {}
+        self.Paths       = {}
+        self.Released    = set()
+        self.Condition   = threading.Condition()
+
+    def run(self):
+        for location in self.Locations:
+            try:
+                identity = FileMetadata.fileIdentity(location)
+            except Exception as error:
+                self.FileCache.log("Prefetching of %s failed: %s" % (location, error))
+                continue
+            with self.Condition:
+                while self.InFlight and sum(self.InFlight.values()) + identity["size"] > self.MaxInFlight and location not in self.Released:
+                    self.Condition.wait()
+                if location in self.Released: continue
+            try:
+                path = self.FileCache.localCopy(location, identity)
+            except Exception as error:
+                # the job itself will try again when it needs the file
+                self.FileCache.log("Prefetching of %s failed: %s" % (location, error))
+                continue
+            with self.Condition:
+                if location not in self.Released:
+                    self.InFlight[location] = os.path.getsize(path)
+                    self.Paths[location]    = path
+                else:
+                    self.FileCache.release(path)
+
+    def release(self, locations):
+        """Called once the job reading the given files has finished, their copies may be evicted from then on."""
+        with self.Condition:
+            for location in locations:
+                self.Released.add(location)
+                self.InFlight.pop(location, None)
+                if location in self.Paths:
+                    self.FileCache.release(self.Paths.pop(location))
+            self.Condition.notify_all()
+
+#======================================================================
+
+class FileLock(object):
+    """Lock on a file, shared between processes. To be used in a with statement. The lock is exclusive unless shared is set,
+    a non blocking lock that is held elsewhere is not taken and Locked is False."""
+    def __init__(self, location, shared = False, blocking = True):
+        super(FileLock, self).__init__()
+        self.Location = location
+        self.Mode     = (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB)
+        self.File     = None
+        self.Locked   = False
+
+    def __enter__(self):
+        self.File = open(self.Location, "a")
+        try:
+            fcntl.flock(self.File, self.Mode)
+            self.Locked = True
+        except BlockingIOError:
+            self.Locked = False
+        return self
+
+    def __exit__(self, *exception):
+        if self.Locked:
+            fcntl.flock(self.File, fcntl.LOCK_UN)
+            self.Locked = False
+        self.File.close()
+
+#======================================================================
+
+def download(location, destination):
+    """Copies a remote file to destination and returns the sha256 checksum and size of the copy.
+    http(s) locations are read directly and checked against the announced size, other protocols go through TFile::Cp."""
+    if not location.startswith(("http://", "https://")):
+        if not ROOT.TFile.Cp(location, destination, False):
+            raise IOError("Could not copy " + location)
+        return fileChecksum(destination), os.path.getsize(destination)
+
+    checksum = hashlib.sha256()
+    size     = 0
+    with urllib.request.urlopen(location) as response, open(destination, "wb") as copy:
+        expected = response.headers.get("Content-Length")
+        block = response.read(blockSize)
+        while block:
+            copy.write(block)
+            checksum.update(block)
+            size += len(block)
+            block = response.read(blockSize)
+    if expected is not None and int(expected) != size:
+        raise IOError("Incomplete download of %s: %d of %s bytes" % (location, size, expected))
+    return checksum.hexdigest(), size
+
+def fileChecksum(path):
+    checksum = hashlib.sha256()
+    with open(path, "rb") as cachedFile:
+        block = cachedFile.read(blockSize)
+        while block:
+            checksum.update(block)
+            block = cachedFile.read(blockSize)
+    return checksum.hexdigest()
@@ -0,0 +1,103 @@
+"""Information about the input files that is expensive to obtain (number of entries, largest multiplicities of the
+collections, the original event counts of skims) is kept in a small json sidecar per input file in the cache directory.
+A sidecar belongs to the file with the recorded location, size and modification time. If any of them changes the
+sidecar is refilled, otherwise it is reused by all later runs. Local copies of remote files (see FileCache.py) share the
+sidecar of the remote file, as they are given its identity.
+"""
+
+import ROOT
+import hashlib
+import json
+import os
+
+from Analysis import EventCounter
+
+#======================================================================
+
+class FileMetadata(object):
+    """Metadata sidecar of a single input file. Values are determined from the file on first use and stored right away.
+    The file is opened without changing the current ROOT directory, so histograms keep being attached to the output file."""
+    def __init__(self, location, directory, identity = None):
+        super(FileMetadata, self).__init__()
+        self.Location        = location
+        self.Identity        = identity or fileIdentity(location)
+        self.SidecarLocation = os.path.join(directory, hashlib.sha1(self.Identity["path"].encode()).hexdigest() + ".json")
+        self.File            = None
+        self.Content         = self.load()
+
+    def entries(self):
+        if self.Content["entries"] is None:
+            self.Content["entries"] = int(self.tree().GetEntries())
+            self.Content["skim"] = self.readSkimCounts()
+            self.save()
+        return self.Content["entries"]
+
+    def maximum(self, branchname):
+        if branchname not in self.Content["maxima"]:
+            self.Content["maxima"][branchname] = int(self.tree().GetMaximum(branchname))
+            self.save()
+        return self.Content["maxima"][branchname]
+
+    def skimCounts(self):
+        """Number of events, sum of weights and sum of squared weights of the sample a skim was made of (see SkimWriter.py),
+        None if the file is not a skim. They are read together with the number of entries, so the file is only opened once."""
+        self.entries()
+        # sidecars written before skims were supported
+        if "skim" not in self.Content:
+            self.Content["skim"] = self.readSkimCounts()
+            self.save()
+        return self.Content["skim"]
+
+    def readSkimCounts(self):
+        self.tree()
+        counter = EventCounter.EventCounter(self.Location)
+        counter.readResults(self.File)
+        if "all" not in counter.RawCounter: return None
+        return [counter.RawCounter["all"], counter.WeightedCounter["all"], counter.SquaredWeightCounter["all"]]
+
+    # Sidecar handling
+    def load(self):
+        if os.path.exists(self.SidecarLocation):
+            with open(self.SidecarLocation) as sidecar:
+                content = json.load(sidecar)
+            if content["identity"] == self.Identity:
+                return content
+        return {"identity" : self.Identity, "entries" : None, "maxima" : {}, "skim" : None}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.SidecarLocation), exist_ok=True)
+        temporary = self.SidecarLocation + ".%d.tmp" % os.getpid()
+        with open(temporary, "w") as sidecar:
+            json.dump(self.Content, sidecar, indent=1, sort_keys=True)
+        os.replace(temporary, self.SidecarLocation)
+
+    # The file itself is only opened when a value is missing from the sidecar
+    def tree(self):
+        if self.File is None:
+            with ROOT.TDirectory.TContext():
+                self.File = ROOT.TFile.Open(self.Location, "READ")
+        return self.File.Get("mini")
+
+    def close(self):
+        if self.File is not None:
+            self.File.Close()
+            self.File = None
+
+#======================================================================
+
+def isRemote(location):
+    return "://" in location and not location.startswith("file://")
+
+def localPath(location):
+    return location[len("file://"):] if location.startswith("file://") else location
+
+def fileIdentity(location):
+    """Location, size and modification time of a local file or a file on a remote server."""
+    if not isRemote(location):
+        stat = os.stat(localPath(location))
+        return {"path" : os.path.abspath(localPath(location)), "size" : stat.st_size, "mtime" : int(stat.st_mtime)}
+    with ROOT.TDirectory.TContext():
+        remoteFile = ROOT.TFile.Open(location, "READ")
+        identity = {"path" : location, "size" : int(remoteFile.GetSize()), "mtime" : int(remoteFile.GetModificationDate().Convert())}
+        remoteFile.Close()
+    return identity
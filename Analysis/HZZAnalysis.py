@@ -1,10 +1,11 @@
 import ROOT
-import itertools 
 import math
 
 from Analysis import Analysis
 from Analysis import AnalysisHelpers
 from Analysis import Constants
+from Analysis import PairingEngine
+from Analysis import StandardHistograms
 
 #======================================================================
         
@@ -15,33 +16,24 @@ class HZZAnalysis(Analysis.Analysis):
 
   
   def initialize(self):
-      self.invMassZ1         =  self.addHistogram("invMassZ1",           ROOT.TH1D("invMassZ1",     "Invariant Mass of the Z boson 1;M_{Z1} [GeV]; Events", 30, 50,106))
-      self.invMassZ2         =  self.addHistogram("invMassZ2",           ROOT.TH1D("invMassZ2",     "Invariant Mass of the Z boson 2;M_{Z2} [GeV]; Events", 30, 60,120))
+      StandardHistograms.addHZZHistograms(self)
 
-      self.mass_four_lep_ext         =  self.addHistogram("mass_four_lep_ext",           ROOT.TH1D("mass_four_lep_ext",     "Invariant Mass of the 4-lepton system;M_{4l} [GeV]; Events",30,80,250))
+      # quantities used in several places of the event selection, computed once per event
+      self.declareDerived("goodLeptons", lambda: AnalysisHelpers.selectAndSortContainer(self.Store.getLeptons(), isGoodLepton, lambda p: p.pt()))
+      self.declareDerived("ZZCandidate", lambda: self.ZZCandidate(self.derived("goodLeptons")))
 
-      self.hist_leptn        =  self.addStandardHistogram("lep_n")
-      self.hist_leptpt       =  self.addStandardHistogram("lep_pt")
-      self.hist_lepteta      =  self.addStandardHistogram("lep_eta")
-      self.hist_leptE        =  self.addStandardHistogram("lep_E")
-      self.hist_leptphi      =  self.addStandardHistogram("lep_phi")
-      self.hist_leptch       =  self.addStandardHistogram("lep_charge")
-      self.hist_leptID       =  self.addStandardHistogram("lep_type")
-      self.hist_leptptc      =  self.addStandardHistogram("lep_ptconerel30")
-      self.hist_leptetc      =  self.addStandardHistogram("lep_etconerel20")
-      self.hist_lepz0        =  self.addStandardHistogram("lep_z0")
-      self.hist_lepd0        =  self.addStandardHistogram("lep_d0")
-
-      self.hist_etmiss       = self.addStandardHistogram("etmiss")
+      # the lepton selection only needs the lepton pt and isolation, the other branches are only read for 4 lepton events
+      self.Stage1Branches = ["lep_n", "lep_pt", "lep_ptcone30", "lep_etcone20"]
 
+  def preselect(self):
+      return len(self.derived("goodLeptons")) == 4
     
   def analyze(self):
       # retrieving objects
-      eventinfo = self.Store.getEventInfo()
-      weight = eventinfo.scalefactor()*eventinfo.eventWeight() if not self.getIsData() else 1
+      weight = self.eventWeight()
 
       # retrieve Leptons  
-      goodLeptons = AnalysisHelpers.selectAndSortContainer(self.Store.getLeptons(), isGoodLepton, lambda p: p.pt())
+      goodLeptons = self.derived("goodLeptons")
       if not len(goodLeptons) == 4: return False
       self.countEvent("4 leptons", weight)
 
@@ -52,15 +44,15 @@ class HZZAnalysis(Analysis.Analysis):
       self.countEvent("3rd lep_pt > 10 GeV", weight)
         
       # find ZZ Candidate
-      candidate = self.ZZCandidate(goodLeptons)
+      candidate = self.derived("ZZCandidate")
       if candidate is None: return False;
 
  
       # ZZ system histograms
-      self.invMassZ1.Fill((candidate[0].tlv() + candidate[1].tlv()).M(), weight)
-      self.invMassZ2.Fill((candidate[2].tlv() + candidate[3].tlv()).M(), weight)
+      self.invMassZ1.Fill(AnalysisHelpers.InvariantMass(candidate[0:2]), weight)
+      self.invMassZ2.Fill(AnalysisHelpers.InvariantMass(candidate[2:4]), weight)
       
-      self.mass_four_lep_ext.Fill((candidate[0].tlv()+candidate[1].tlv()+candidate[2].tlv()+candidate[3].tlv()).M(),weight)
+      self.mass_four_lep_ext.Fill(AnalysisHelpers.InvariantMass(candidate),weight)
 
       # lepton histograms
       self.hist_leptn.Fill(len(goodLeptons), weight)
@@ -79,7 +71,7 @@ class HZZAnalysis(Analysis.Analysis):
       pass
     
   def ZWindow(self, lep1, lep2):
-      return abs((lep1.tlv()+lep2.tlv()).M() - Constants.Z_Mass)
+      return abs(AnalysisHelpers.InvariantMass([lep1, lep2]) - Constants.Z_Mass)
     
   def DoubleZWindow(self, candidate):
       return self.ZWindow(candidate[0], candidate[1]) + self.ZWindow(candidate[2], candidate[3])
@@ -90,15 +82,13 @@ class HZZAnalysis(Analysis.Analysis):
           if abs(lep1.pdgId()) != abs(lep2.pdgId()): return False
           return True
     
-      bestCandidate = None
-      for p in itertools.permutations(leptons, 4):
-         if not isValidCandidate(p[0], p[1]): continue
-         if not isValidCandidate(p[2], p[3]): continue 
-         if bestCandidate is None:
-             bestCandidate = p            
-         if self.DoubleZWindow(p) < self.DoubleZWindow(bestCandidate):
-             bestCandidate = p
-      return bestCandidate
+      # every pair is checked and its Z window computed only once, the engine combines them into the best candidate
+      engine = PairingEngine.getEngine(len(leptons))
+      valid  = [isValidCandidate(leptons[i], leptons[j]) for i, j in engine.Pairs]
+      window = [self.ZWindow(leptons[i], leptons[j]) if valid[n] else None for n, (i, j) in enumerate(engine.Pairs)]
+      best   = engine.bestAssignment(window, valid)
+      if best is None: return None
+      return tuple(leptons[i] for i in best)
 
   
 def isGoodLepton(Lepton):
@@ -0,0 +1,58 @@
+import ROOT
+
+from Analysis import DeclarativeAnalysis
+from Analysis import Constants
+from Analysis import HZZSelection
+from Analysis import StandardHistograms
+
+#======================================================================
+
+class HZZDataFrameAnalysis(DeclarativeAnalysis.DeclarativeAnalysis):
+  """Declarative version of the HZZAnalysis, run as a ROOT.RDataFrame graph on all cores. Cutflow and histograms are
+  the same as those of the HZZAnalysis."""
+  def __init__(self, store):
+      super(HZZDataFrameAnalysis, self).__init__(store)
+
+  def initialize(self):
+      HZZSelection.declare(self)
+
+      StandardHistograms.addHZZHistograms(self)
+
+      # event selection
+      self.define("goodLeptons", "HZZSelection::goodLeptons(lep_pt, lep_ptcone30, lep_etcone20)")
+      self.define("leptonCuts",  "HZZSelection::leptonCuts(goodLeptons, lep_pt)")
+      for i, cut in enumerate(HZZSelection.cuts):
+          self.filter("leptonCuts > %d" % i, cut)
+      self.define("goodLeptons_pt", "HZZSelection::take(lep_pt, goodLeptons, 0.001)")
+
+      # find ZZ Candidate
+      self.define("ZZCandidate", "HZZSelection::zzCandidate(goodLeptons, lep_pt, lep_eta, lep_phi, lep_E, lep_charge, lep_type, %r)" % Constants.Z_Mass)
+      self.filter("ZZCandidate.size() == 4")
+
+      # ZZ system histograms
+      self.define("invMassZ1", "HZZSelection::mass(ZZCandidate, 0, 2, lep_pt, lep_eta, lep_phi, lep_E)")
+      self.define("invMassZ2", "HZZSelection::mass(ZZCandidate, 2, 4, lep_pt, lep_eta, lep_phi, lep_E)")
+      self.define("mass_four_lep_ext", "HZZSelection::mass(ZZCandidate, 0, 4, lep_pt, lep_eta, lep_phi, lep_E)")
+      self.fill(self.invMassZ1, "invMassZ1")
+      self.fill(self.invMassZ2, "invMassZ2")
+      self.fill(self.mass_four_lep_ext, "mass_four_lep_ext")
+
+      # lepton histograms
+      self.define("goodLeptons_n",      "int(goodLeptons.size())")
+      self.define("goodLeptons_weight", "ROOT::VecOps::RVec<double>(goodLeptons.size(), weight)")
+      self.define("goodLeptons_eta",    "HZZSelection::take(lep_eta, goodLeptons, 1)")
+      self.define("goodLeptons_E",      "HZZSelection::take(lep_E, goodLeptons, 0.001)")
+      self.define("goodLeptons_phi",    "HZZSelection::take(lep_phi, goodLeptons, 1)")
+      self.define("goodLeptons_charge", "HZZSelection::take(lep_charge, goodLeptons)")
+      self.define("goodLeptons_type",   "HZZSelection::take(lep_type, goodLeptons)")
+      self.define("goodLeptons_ptc",    "HZZSelection::ratio(lep_ptcone30, lep_pt, goodLeptons)")
+      self.define("goodLeptons_etc",    "HZZSelection::ratio(lep_etcone20, lep_pt, goodLeptons)")
+      self.fill(self.hist_leptn,   "goodLeptons_n")
+      self.fill(self.hist_leptpt,  "goodLeptons_pt",     "goodLeptons_weight")
+      self.fill(self.hist_lepteta, "goodLeptons_eta",    "goodLeptons_weight")
+      self.fill(self.hist_leptE,   "goodLeptons_E",      "goodLeptons_weight")
+      self.fill(self.hist_leptphi, "goodLeptons_phi",    "goodLeptons_weight")
+      self.fill(self.hist_leptch,  "goodLeptons_charge", "goodLeptons_weight")
+      self.fill(self.hist_leptID,  "goodLeptons_type",   "goodLeptons_weight")
+      self.fill(self.hist_leptptc, "goodLeptons_ptc",    "goodLeptons_weight")
+      self.fill(self.hist_leptetc, "goodLeptons_etc",    "goodLeptons_weight")
@@ -0,0 +1,73 @@
+import ROOT
+import numpy
+
+from Analysis import VectorAnalysis
+from Analysis import Kinematics
+from Analysis import VectorHelpers
+from Analysis import Constants
+from Analysis import HZZSelection
+from Analysis import StandardHistograms
+
+#======================================================================
+
+class HZZKernelAnalysis(VectorAnalysis.VectorAnalysis):
+  """Vectorised version of the HZZAnalysis, with the lepton selection and the search for the ZZ candidate done by a C++ kernel
+  that is compiled once and cached (see Kernels.py). Cutflow and histograms are the same as those of the HZZAnalysis."""
+  def __init__(self, store):
+      super(HZZKernelAnalysis, self).__init__(store)
+
+  def initialize(self):
+      self.Kernels = HZZSelection.declare(self)
+
+      StandardHistograms.addHZZHistograms(self)
+
+  # event selection in the kernel, run once per batch
+  def selection(self, batch):
+      if "selection" not in batch.Derived:
+          stage     = numpy.zeros(batch.Size, dtype=numpy.int32)
+          good      = numpy.full((batch.Size, 4), -1, dtype=numpy.int32)
+          candidate = numpy.full((batch.Size, 4), -1, dtype=numpy.int32)
+          offsets   = batch.offsets("lep_pt").astype(numpy.int32)
+          self.Kernels.select(batch.Size, offsets, batch["lep_pt"], batch["lep_eta"], batch["lep_phi"], batch["lep_E"],
+                              batch["lep_ptcone30"], batch["lep_etcone20"], batch["lep_type"], batch["lep_charge"], Constants.Z_Mass,
+                              stage, good.reshape(-1), candidate.reshape(-1))
+          batch.Derived["selection"] = (stage, good, candidate)
+      return batch.Derived["selection"]
+
+  # events with four good leptons, like HZZAnalysis.preselect
+  def preselectBatch(self, batch):
+      stage, good, candidate = self.selection(batch)
+      return stage >= 1
+
+  def analyzeBatch(self, batch):
+      weights = self.getWeights(batch)
+      stage, good, candidate = self.selection(batch)
+
+      for i, cut in enumerate(HZZSelection.cuts):
+          self.countEvent(cut, weights[stage > i])
+      passed = stage == 4
+      if not passed.any(): return passed
+
+      # ZZ system histograms
+      selected = weights[passed]
+      leptons  = candidate[passed]
+      pt, eta, phi, e = VectorHelpers.pt(batch, "lep"), VectorHelpers.column(batch, "lep_eta"), VectorHelpers.column(batch, "lep_phi"), VectorHelpers.column(batch, "lep_E", 0.001)
+      def mass(indices):
+          return Kinematics.massOfSystem(pt[indices], eta[indices], phi[indices], e[indices])
+      self.fillHistogram(self.invMassZ1, mass(leptons[:, 0:2]), selected)
+      self.fillHistogram(self.invMassZ2, mass(leptons[:, 2:4]), selected)
+      self.fillHistogram(self.mass_four_lep_ext, mass(leptons), selected)
+
+      # lepton histograms, the leptons of each event in the order of decreasing pt
+      leptons  = good[passed].reshape(-1)
+      repeated = numpy.repeat(selected, 4)
+      self.fillHistogram(self.hist_leptn,   numpy.full(len(selected), 4.), selected)
+      self.fillHistogram(self.hist_leptpt,  pt[leptons], repeated)
+      self.fillHistogram(self.hist_lepteta, eta[leptons], repeated)
+      self.fillHistogram(self.hist_leptE,   e[leptons], repeated)
+      self.fillHistogram(self.hist_leptphi, phi[leptons], repeated)
+      self.fillHistogram(self.hist_leptch,  batch["lep_charge"][leptons], repeated)
+      self.fillHistogram(self.hist_leptID,  batch["lep_type"][leptons], repeated)
+      self.fillHistogram(self.hist_leptptc, VectorHelpers.isoptconerel30(batch, "lep")[leptons], repeated)
+      self.fillHistogram(self.hist_leptetc, VectorHelpers.isoetconerel20(batch, "lep")[leptons], repeated)
+      return passed
@@ -0,0 +1,153 @@
+"""The event selection of the HZZAnalysis in C++, declared by the HZZKernelAnalysis (one call per batch) and by the
+HZZDataFrameAnalysis (one call per event in the data frame), so both use the same definition. The cuts are those of the
+HZZAnalysis, the ways of pairing the four leptons into Z1 and Z2 are taken from the PairingEngine.
+"""
+
+from Analysis import PairingEngine
+
+# cuts counted in the cutflow, leptonCuts returns the number of them that are passed
+cuts = ["4 leptons", "2nd lep_pt > 15 GeV", "3rd lep_pt > 10 GeV"]
+
+template = """
+#include <ROOT/RVec.hxx>
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+namespace HZZSelection {
+
+  using Floats  = ROOT::VecOps::RVec<float>;
+  using Ints    = ROOT::VecOps::RVec<int>;
+  using Doubles = ROOT::VecOps::RVec<double>;
+
+  // the pairings (Z1 = a b, Z2 = c d) of four leptons in the order of the PairingEngine
+  static const int nAssignments = %(nAssignments)d;
+  static const int assignments[%(nAssignments)d][4] = {%(assignments)s};
+
+  // invariant mass of the leptons with the given indices
+  double mass(const int* leptons, int n, const float* pt, const float* eta, const float* phi, const float* e) {
+    double px = 0, py = 0, pz = 0, en = 0;
+    for (int k = 0; k < n; ++k) {
+      int i = leptons[k];
+      double p = pt[i]*0.001;
+      px += p*std::cos((double)phi[i]);
+      py += p*std::sin((double)phi[i]);
+      pz += p*std::sinh((double)eta[i]);
+      en += e[i]*0.001;
+    }
+    double mm = en*en - (px*px + py*py + pz*pz);
+    return mm < 0 ? -std::sqrt(-mm) : std::sqrt(mm);
+  }
+
+  // appends the indices in [begin, end) of the isolated leptons to good, ordered by decreasing pt
+  void goodLeptons(int begin, int end, const float* pt, const float* ptcone30, const float* etcone20, std::vector<int>& good) {
+    for (int i = begin; i < end; ++i) {
+      if (!((double)etcone20[i]/(double)pt[i] < 0.15)) continue;
+      if (!((double)ptcone30[i]/(double)pt[i] < 0.15)) continue;
+      good.push_back(i);
+    }
+    std::stable_sort(good.begin(), good.end(), [pt](int a, int b) { return pt[a]*0.001 > pt[b]*0.001; });
+  }
+
+  // number of the lepton cuts passed (see HZZSelection.cuts)
+  int leptonCuts(const int* good, int n, const float* pt) {
+    if (n != 4) return 0;
+    if (!(pt[good[1]]*0.001 > 15)) return 1;
+    if (!(pt[good[2]]*0.001 > 10)) return 2;
+    return 3;
+  }
+
+  // indices of the leptons of Z1 and Z2 of the valid pairing closest to two Z bosons, false if there is none
+  bool zzCandidate(const int* good, const float* pt, const float* eta, const float* phi, const float* e,
+                   const int* charge, const int* type, double zMass, int* candidate) {
+    int best = -1;
+    double bestWindow = 0;
+    for (int n = 0; n < nAssignments; ++n) {
+      int l[4];
+      for (int k = 0; k < 4; ++k) l[k] = good[assignments[n][k]];
+      bool valid = charge[l[0]]*charge[l[1]] <= 0 && std::abs(type[l[0]]) == std::abs(type[l[1]])
+                && charge[l[2]]*charge[l[3]] <= 0 && std::abs(type[l[2]]) == std::abs(type[l[3]]);
+      if (!valid) continue;
+      double window = std::fabs(mass(l, 2, pt, eta, phi, e) - zMass) + std::fabs(mass(l + 2, 2, pt, eta, phi, e) - zMass);
+      if (best < 0 || window < bestWindow) {
+        best = n;
+        bestWindow = window;
+      }
+    }
+    if (best < 0) return false;
+    for (int k = 0; k < 4; ++k) candidate[k] = good[assignments[best][k]];
+    return true;
+  }
+
+  // Batches: the leptons are the flat collection branches with the offsets delimiting the events.
+  // stage: number of cuts passed (1-3: lepton cuts, 4: ZZ candidate found)
+  // good: indices of the four good leptons ordered by pt, candidate: indices of the leptons of Z1 and Z2
+  void select(int nEvents, const int* offsets, const float* pt, const float* eta, const float* phi, const float* e,
+              const float* ptcone30, const float* etcone20, const int* type, const int* charge, double zMass,
+              int* stage, int* good, int* candidate) {
+    std::vector<int> leptons;
+    for (int event = 0; event < nEvents; ++event) {
+      leptons.clear();
+      goodLeptons(offsets[event], offsets[event + 1], pt, ptcone30, etcone20, leptons);
+      stage[event] = leptonCuts(leptons.data(), leptons.size(), pt);
+      if (stage[event] == 0) continue;
+      std::copy(leptons.begin(), leptons.end(), good + 4*event);
+      if (stage[event] < 3) continue;
+      if (zzCandidate(leptons.data(), pt, eta, phi, e, charge, type, zMass, candidate + 4*event)) stage[event] = 4;
+    }
+  }
+
+  // Single events of a data frame
+  Ints goodLeptons(const Floats& pt, const Floats& ptcone30, const Floats& etcone20) {
+    std::vector<int> good;
+    goodLeptons(0, pt.size(), pt.data(), ptcone30.data(), etcone20.data(), good);
+    return Ints(good.begin(), good.end());
+  }
+
+  int leptonCuts(const Ints& good, const Floats& pt) {
+    return leptonCuts(good.data(), good.size(), pt.data());
+  }
+
+  Ints zzCandidate(const Ints& good, const Floats& pt, const Floats& eta, const Floats& phi, const Floats& e,
+                   const Ints& charge, const Ints& type, double zMass) {
+    Ints candidate(4);
+    if (good.size() != 4 || !zzCandidate(good.data(), pt.data(), eta.data(), phi.data(), e.data(), charge.data(), type.data(), zMass, candidate.data()))
+      return Ints();
+    return candidate;
+  }
+
+  // invariant mass of the leptons indices[first], ..., indices[last - 1]
+  double mass(const Ints& indices, int first, int last, const Floats& pt, const Floats& eta, const Floats& phi, const Floats& e) {
+    return mass(indices.data() + first, last - first, pt.data(), eta.data(), phi.data(), e.data());
+  }
+
+  Doubles take(const Floats& values, const Ints& indices, double scale) {
+    Doubles result;
+    for (int i : indices) result.push_back(values[i]*scale);
+    return result;
+  }
+
+  Doubles take(const Ints& values, const Ints& indices) {
+    Doubles result;
+    for (int i : indices) result.push_back(values[i]);
+    return result;
+  }
+
+  Doubles ratio(const Floats& numerator, const Floats& denominator, const Ints& indices) {
+    Doubles result;
+    for (int i : indices) result.push_back((double)numerator[i]/(double)denominator[i]);
+    return result;
+  }
+}
+"""
+
+#======================================================================
+
+def source():
+    assignments = PairingEngine.getEngine(4).Assignments
+    return template % {"nAssignments" : len(assignments),
+                       "assignments"  : ", ".join("{%s}" % ", ".join(str(i) for i in assignment) for assignment in assignments)}
+
+def declare(analysis):
+    """Compiles (once) and loads the selection, returns the namespace HZZSelection."""
+    return analysis.declareKernels("HZZSelection", source())
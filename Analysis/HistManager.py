@@ -1,5 +1,7 @@
 import ROOT
+import numpy
 import time
+from array import array
 from Analysis import StandardHistograms
 
 #======================================================================
@@ -10,6 +12,8 @@ class HistManager(object):
         super(HistManager, self).__init__()
         # Configurable
         self.Name = name
+        self.BufferSize = 0
+        self.Backend    = "root"
 
         self.Histograms = {}
 
@@ -26,6 +30,12 @@ class HistManager(object):
         if histName in self.Histograms:
             print("Histogram with name " + histName + " already defined!")
         else:
+            if self.Backend == "numpy" and ArrayHistogram.supports(histogram) and not isinstance(histogram, ArrayHistogram):
+                # the TH1 is only used for its binning, it must not end up in the output file next to the converted one
+                histogram.SetDirectory(ROOT.nullptr)
+                histogram = ArrayHistogram.fromHistogram(histogram)
+            elif self.BufferSize > 0 and BufferedHistogram.supports(histogram):
+                histogram = BufferedHistogram(histogram, self.BufferSize)
             self.Histograms[histName] = histogram
         return histogram
         
@@ -36,10 +46,204 @@ class HistManager(object):
             return None
         return self.addHistogram(histName, histogram)
 
+    # Fills all values of an array at once, weights may be an array of the same length or a single number
+    def fillArray(self, histogram, values, weights = 1):
+        values = numpy.ascontiguousarray(values, dtype=numpy.float64)
+        if len(values) == 0: return
+        weights = numpy.ascontiguousarray(numpy.broadcast_to(weights, values.shape), dtype=numpy.float64)
+        if isinstance(histogram, ArrayHistogram):
+            histogram.fill(values, weights)
+        else:
+            histogram.FillN(len(values), values, weights)
+
     def writeHistograms(self):
-        [hist.Write() for hist in self.Histograms.values()]
+        self.flush()
+        [hist.toHistogram().Write() if isinstance(hist, ArrayHistogram) else hist.Write() for hist in self.Histograms.values()]
+
+    def flush(self):
+        [hist.flush() for hist in self.Histograms.values() if isinstance(hist, BufferedHistogram)]
 
     # Utility function
     def log(self, message):
         print(time.ctime() + " HistManager " + self.Name + ": " + message)
-        
+
+#======================================================================
+
+class BufferedHistogram(object):
+    """Wrapper around a one dimensional histogram that collects the values and weights passed to Fill in preallocated
+    arrays and hands them to the histogram with a single TH1::FillN call once the buffer is full. FillN performs the
+    same steps as Fill for every entry, so the result is identical to filling directly.
+    Every other method is forwarded to the histogram after flushing the buffer, so the wrapper can be used like the
+    histogram itself: isinstance checks see the class of the histogram, and the TH1 methods taking another histogram
+    (Add, Divide, Multiply) are given the flushed histogram instead of the wrapper. Other ROOT functions need
+    unwrap(hist).
+    """
+    def __init__(self, histogram, size):
+        super(BufferedHistogram, self).__init__()
+        acceptBufferedHistograms()
+        self.Histogram = histogram
+        self.Size      = size
+        self.Values    = array('d', [0.0])*size
+        self.Weights   = array('d', [0.0])*size
+        self.Entries   = 0
+
+    @staticmethod
+    def supports(histogram):
+        return not isinstance(histogram, ArrayHistogram) and histogram.GetDimension() == 1 and not histogram.InheritsFrom("TProfile")
+
+    def Fill(self, value, weight = 1.0):
+        if isinstance(value, str):
+            # filling by bin label
+            self.flush()
+            return self.Histogram.Fill(value, weight)
+        self.Values[self.Entries]  = value
+        self.Weights[self.Entries] = weight
+        self.Entries += 1
+        if self.Entries == self.Size:
+            self.flush()
+        # like TH1::Fill for a value kept in the buffer of the histogram (see TH1::SetBuffer)
+        return -2
+
+    def flush(self):
+        if self.Entries > 0:
+            self.Histogram.FillN(self.Entries, self.Values, self.Weights)
+            self.Entries = 0
+
+    @property
+    def __class__(self):
+        return self.Histogram.__class__
+
+    def __getattr__(self, name):
+        self.flush()
+        return getattr(self.Histogram, name)
+
+#======================================================================
+
+class ArrayHistogram(object):
+    """One dimensional histogram kept in numpy arrays, as an alternative to a TH1D that does not need ROOT until it is
+    written. It holds the sum of weights and the sum of squared weights per bin, including the underflow (bin 0) and
+    overflow (bin nbins+1), and the statistics of a TH1 (number of entries, sums of w, w^2, w*x, w*x^2 within the range).
+    Values are assigned to bins like TAxis::FindBin does. Histograms with the same binning are added with add(), also
+    after they were sent between processes, and converted to a TH1D with toHistogram().
+    Single values passed to Fill are collected in lists and binned together with the next array, when BufferSize of them
+    are pending or when the histogram is read.
+    """
+    BufferSize = 100000
+
+    def __init__(self, name, title, nbins, low = None, high = None):
+        super(ArrayHistogram, self).__init__()
+        self.Name  = name
+        self.Title = title
+        if low is None:
+            # nbins holds the bin edges
+            self.Edges   = numpy.asarray(nbins, dtype=numpy.float64)
+            self.Uniform = False
+        else:
+            self.Edges   = numpy.linspace(low, high, nbins + 1)
+            self.Uniform = True
+        self.NBins   = len(self.Edges) - 1
+        self.Low     = float(self.Edges[0])
+        self.High    = float(self.Edges[-1])
+        self.SumW    = numpy.zeros(self.NBins + 2)
+        self.SumW2   = numpy.zeros(self.NBins + 2)
+        self.Stats   = numpy.zeros(4)
+        self.Entries = 0
+        self.PendingValues  = []
+        self.PendingWeights = []
+
+    @classmethod
+    def fromHistogram(cls, histogram):
+        """Takes over name, title and binning of an empty TH1."""
+        axis  = histogram.GetXaxis()
+        title = "%s;%s;%s" % (histogram.GetTitle(), axis.GetTitle(), histogram.GetYaxis().GetTitle())
+        if axis.IsVariableBinSize():
+            return cls(histogram.GetName(), title, [axis.GetBinLowEdge(i) for i in range(1, axis.GetNbins() + 2)])
+        return cls(histogram.GetName(), title, axis.GetNbins(), axis.GetXmin(), axis.GetXmax())
+
+    @staticmethod
+    def supports(histogram):
+        return isinstance(histogram, ArrayHistogram) or (histogram.GetDimension() == 1 and not histogram.InheritsFrom("TProfile"))
+
+    # Filling
+    def findBins(self, values):
+        if self.Uniform:
+            with numpy.errstate(invalid="ignore"):
+                bins = 1 + (self.NBins*(values - self.Low)/(self.High - self.Low)).astype(numpy.int64)
+        else:
+            bins = numpy.searchsorted(self.Edges, values, side="right")
+        bins = numpy.where(values < self.Low, 0, bins)
+        return numpy.where(values < self.High, bins, self.NBins + 1)
+
+    def fill(self, values, weights = 1):
+        values  = numpy.asarray(values, dtype=numpy.float64).ravel()
+        weights = numpy.broadcast_to(numpy.asarray(weights, dtype=numpy.float64), values.shape)
+        if self.PendingValues:
+            values  = numpy.concatenate((self.PendingValues, values))
+            weights = numpy.concatenate((self.PendingWeights, weights))
+            self.PendingValues, self.PendingWeights = [], []
+        bins    = self.findBins(values)
+        self.SumW  += numpy.bincount(bins, weights, minlength=self.NBins + 2)
+        self.SumW2 += numpy.bincount(bins, weights*weights, minlength=self.NBins + 2)
+        inRange = (bins > 0) & (bins <= self.NBins)
+        w, x = weights[inRange], values[inRange]
+        self.Stats   += [w.sum(), (w*w).sum(), (w*x).sum(), (w*x*x).sum()]
+        self.Entries += len(values)
+
+    def Fill(self, value, weight = 1.0):
+        self.PendingValues.append(value)
+        self.PendingWeights.append(weight)
+        if len(self.PendingValues) >= self.BufferSize:
+            self.flush()
+
+    def flush(self):
+        if self.PendingValues:
+            self.fill([])
+
+    def FillN(self, n, values, weights):
+        self.fill(numpy.asarray(values)[:n], numpy.asarray(weights)[:n])
+
+    # Merging and conversion
+    def add(self, other):
+        if self.NBins != other.NBins or not numpy.array_equal(self.Edges, other.Edges):
+            raise ValueError("Cannot add histograms %s and %s with different binning" % (self.Name, other.Name))
+        self.flush()
+        other.flush()
+        self.SumW    += other.SumW
+        self.SumW2   += other.SumW2
+        self.Stats   += other.Stats
+        self.Entries += other.Entries
+
+    def toHistogram(self):
+        """Returns an equivalent TH1D, created in the current directory."""
+        self.flush()
+        if self.Uniform:
+            histogram = ROOT.TH1D(self.Name, self.Title, self.NBins, self.Low, self.High)
+        else:
+            histogram = ROOT.TH1D(self.Name, self.Title, self.NBins, array('d', self.Edges))
+        histogram.Sumw2()
+        for i in range(self.NBins + 2):
+            histogram.SetBinContent(i, self.SumW[i])
+            histogram.GetSumw2().SetAt(self.SumW2[i], i)
+        histogram.PutStats(array('d', self.Stats))
+        histogram.SetEntries(self.Entries)
+        return histogram
+
+#======================================================================
+
+def unwrap(histogram):
+    """The histogram itself, with all buffered values filled, for a BufferedHistogram, any other object unchanged."""
+    if type(histogram) is BufferedHistogram:
+        histogram.flush()
+        return histogram.Histogram
+    return histogram
+
+# The TH1 methods taking other histograms unwrap them, so they accept buffered histograms like the histograms themselves
+histogramMethods = ["Add", "Divide", "Multiply"]
+pythonized       = []
+
+def acceptBufferedHistograms():
+    if pythonized: return
+    for name in histogramMethods:
+        method = getattr(ROOT.TH1, name)
+        setattr(ROOT.TH1, name, lambda self, *args, method=method: method(self, *[unwrap(arg) for arg in args]))
+    pythonized.append(True)
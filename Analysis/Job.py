@@ -1,9 +1,18 @@
 import ROOT
 import importlib
+import os
 import sys
 import time
 
 from Analysis import JobStatistics
+from Analysis import FileMetadata
+from Analysis import FileCache
+from Analysis import BatchReader
+from Analysis import ColumnCache
+from Analysis import VectorAnalysis
+from Analysis import DeclarativeAnalysis
+from Analysis import DataFrameEngine
+from Analysis import SkimWriter
 
 #======================================================================
 
@@ -11,37 +20,82 @@ class Job(object):
     """This class is a carrier class for a given analysis. It takes care of the technical details like
     file writing, setting up the input tree and providing statistics about the status of the analysis.    
     """
-    def __init__(self, processName, configuration, inputLocation):
+    def __init__(self, processName, configuration, inputLocation, entryRange = None, shardIndex = 0):
         super(Job, self).__init__()
         #Configurables
         self.Name       = processName
         self.Configuration = configuration
         self.MaxEvents     = configuration["MaxEvents"]
         self.InputFiles    = [str(inputLocation)]
+        # A job may be restricted to the entries [first, last) of the sample, which are aligned to cluster boundaries
+        self.EntryRange    = entryRange
+        self.FirstEvent    = 0
+        self.LastEvent     = 0
+        # number of entries looped over, fewer than the range after a preselection
+        self.NEntries      = 0
 
-        # Outputs
+        # Outputs - jobs processing a part of a sample write partial outputs that are merged afterwards
         self.OutputFileLocation = configuration["OutputDirectory"] + processName
+        if entryRange is not None:
+            self.OutputFileLocation += ".part%d" % shardIndex
         self.OutputFile = None
+        self.SkimWriter = None
+
+        # Read statistics of the process at the start of the job
+        self.BytesRead = 0
+        self.ReadCalls = 0
 
         # Classes - InputTree and Analysis have to be created later otherwise parallel running does not work
         self.InputTree     = None
+        self.Metadata      = []
+        self.FileCache     = None
         self.Analysis      = None
         self.JobStatistics = JobStatistics.JobStatistics(self.Configuration["MaxEvents"], self.Configuration["Batch"])
 
     #Setup functions
     def setupTree(self):
+      # asynchronous prefetching has to be switched on before the first file is opened
+      if self.Configuration.get("AsyncPrefetching", False):
+        ROOT.gEnv.SetValue("TFile.AsyncPrefetching", 1)
       tree = ROOT.TChain("mini")
-      for filename in self.InputFiles:
-        self.log("Adding file: " + filename)
-        tree.Add(filename)
+      # remote files are asked for their identity once, their cached copies are described by the sidecar of the remote file
+      identities = [FileMetadata.fileIdentity(location) if FileMetadata.isRemote(location) else None for location in self.InputFiles]
+      self.Metadata = [FileMetadata.FileMetadata(filename, self.cacheDirectory("metadata"), identity)
+                       for filename, identity in zip(self.localInputFiles(identities), identities)]
+      for metadata in self.Metadata:
+        self.log("Adding file: " + metadata.Location)
+        tree.Add(metadata.Location, metadata.entries())
+      self.setupTreeCache(tree)
       return tree
+
+    def setupTreeCache(self, tree):
+      cacheSize    = int(self.Configuration.get("TreeCacheSize", 30000000))
+      learnEntries = int(self.Configuration.get("TreeCacheLearnEntries", 100))
+      tree.SetCacheSize(cacheSize)
+      if cacheSize > 0:
+        tree.SetCacheLearnEntries(learnEntries)
+      self.log("TTreeCache size: %.1f MB, learning phase: %d entries, asynchronous prefetching: %s"
+               % (cacheSize/1e6, learnEntries, "on" if self.Configuration.get("AsyncPrefetching", False) else "off"))
                     
     def createAnalysis(self, analysisName):
         analysisName = self.Configuration["Analysis"]
         importedAnalysisModule = importlib.import_module("Analysis." + analysisName)
         analysis = getattr(importedAnalysisModule, analysisName)(self.Name)
-        analysis.Store.initializeTuple(self.InputTree)
+        # only the event loop fills histograms value by value, batches and data frames fill whole arrays
+        if not isinstance(analysis, (VectorAnalysis.VectorAnalysis, DeclarativeAnalysis.DeclarativeAnalysis)):
+            analysis.HistManager.BufferSize = int(self.Configuration.get("HistogramBuffer", 1000))
+        analysis.HistManager.Backend    = self.Configuration.get("HistogramBackend", "root")
+        analysis.KernelDirectory        = self.cacheDirectory("kernels")
         analysis.setIsData("data" in self.Name.lower())
+        if isinstance(analysis, DeclarativeAnalysis.DeclarativeAnalysis):
+            # the data frame reads the input files itself, the TupleReader is not used
+            return analysis
+        analysis.Store.Metadata = self.Metadata
+        analysis.Store.initializeTuple(self.InputTree)
+        if self.Configuration.get("RecordBranches", False) and self.readBranchList(analysis.Store):
+            # the branches to be read are known already, no need to learn them
+            if self.InputTree.GetCacheSize() > 0:
+                self.InputTree.StopCacheLearningPhase()
         return analysis
     
     #Execution functions                    
@@ -53,25 +107,76 @@ class Job(object):
     def initialize(self):
       self.log("Intialization phase")
       self.JobStatistics.resetTimer()
+      # the read statistics of TFile are totals of the process, which may have run other jobs before
+      self.BytesRead, self.ReadCalls = ROOT.TFile.GetFileBytesRead(), ROOT.TFile.GetFileReadCalls()
       self.OutputFile = ROOT.TFile.Open(self.OutputFileLocation + ".root","RECREATE")
       self.InputTree = self.setupTree()
       self.Analysis  = self.createAnalysis(self.Configuration["Analysis"])
       self.determineMaxEvents()
       self.Analysis.doInitialization()
+      self.countSkimmedEvents()
+      if self.Configuration.get("Skim", ""):
+        self.SkimWriter = SkimWriter.SkimWriter(os.path.join(self.Configuration["Skim"], os.path.basename(self.OutputFileLocation) + ".root"))
         
     def execute(self):
-      self.log("Now looping over %d events" % self.MaxEvents)
-      for n in range(self.MaxEvents):
-        self.JobStatistics.updateStatus(n)
-        self.InputTree.GetEntry(n)
-        self.Analysis.doAnalysis()
+      if isinstance(self.Analysis, VectorAnalysis.VectorAnalysis):
+        self.executeBatches()
+        return
+      if isinstance(self.Analysis, DeclarativeAnalysis.DeclarativeAnalysis):
+        self.executeDataFrame()
+        return
+      self.log("Now looping over %d events" % (self.LastEvent - self.FirstEvent))
+      entries = range(self.FirstEvent, self.LastEvent)
+      if self.Configuration.get("Preselection", ""):
+        entries = self.preselectEntries(self.Configuration["Preselection"])
+      stage1 = self.Analysis.Stage1Branches or None
+      if stage1:
+        self.log("Staged reading, first reading " + ", ".join(stage1))
+      # the progress counts the entries processed, which are not consecutive after a preselection
+      for processed, n in enumerate(entries):
+        self.JobStatistics.updateStatus(processed)
+        self.Analysis.Store.GetEntry(n, stage1)
+        if self.Analysis.doAnalysis() and self.SkimWriter:
+          self.SkimWriter.add(n)
+
+    def executeBatches(self):
+      self.log("Now looping over %d events in batches" % (self.LastEvent - self.FirstEvent))
+      columnCache = None
+      if self.Configuration.get("ColumnCache", False):
+        columnCache = ColumnCache.ColumnCache(self.Metadata, self.cacheDirectory("columns"))
+      reader = BatchReader.BatchReader(self.Analysis.Store, columnCache)
+      for batch in reader.batches(self.FirstEvent, self.LastEvent, self.Configuration.get("BatchSize", 10000)):
+        preselected = self.Analysis.doAnalysisBatch(batch)
+        if self.SkimWriter:
+          self.SkimWriter.addEntries((preselected.nonzero()[0] + batch.First).tolist())
+        self.JobStatistics.updateStatus(batch.Last - self.FirstEvent, True)
+
+    def executeDataFrame(self):
+      self.log("Now running the data frame over %d events" % (self.LastEvent - self.FirstEvent))
+      if self.SkimWriter:
+        self.log("Skims are not written for declarative analyses")
+        self.SkimWriter = None
+      engine = DataFrameEngine.DataFrameEngine(self.Analysis, "mini", [metadata.Location for metadata in self.Metadata])
+      engine.run(self.FirstEvent, self.LastEvent, self.InputTree.GetEntries(), int(self.Configuration.get("Threads", 0)),
+                 self.Configuration.get("Preselection", ""))
             
     def finalize(self):
-      self.JobStatistics.updateStatus(self.MaxEvents, True)
+      self.JobStatistics.updateStatus(self.NEntries, True)
       if not self.Configuration["Batch"]:
           print("")
       self.Analysis.doFinalization()
+      if self.SkimWriter:
+          # the skim keeps the branches of the Preselection, so it can be preselected again
+          preselection = self.Configuration.get("Preselection", "")
+          self.SkimWriter.write(self.InputTree, self.Analysis.EventCounter, self.formulaBranches(preselection) if preselection else [])
+      if self.Configuration.get("RecordBranches", False) and not isinstance(self.Analysis, DeclarativeAnalysis.DeclarativeAnalysis):
+          self.writeBranchList(self.Analysis.Store)
+      [metadata.close() for metadata in self.Metadata]
+      # the cached copies of the input files may be evicted from now on
+      if self.FileCache:
+          self.FileCache.releaseAll()
       self.OutputFile.Close()
+      self.log("read %.1f MB in %d read calls" % ((ROOT.TFile.GetFileBytesRead() - self.BytesRead)/1e6, ROOT.TFile.GetFileReadCalls() - self.ReadCalls))
       self.log("finished successfully. Total time: %4.0fs" % self.JobStatistics.elapsedTime())
 
 
@@ -82,14 +187,115 @@ class Job(object):
         self.log("Empty files! Abort!")
         sys.exit(1)
       
-      if self.MaxEvents > nentries:
-        self.MaxEvents = nentries
-      
-      self.MaxEvents = int(self.MaxEvents*self.Configuration["Fraction"]) 
-      self.JobStatistics.setMaxEvents(self.MaxEvents)
+      self.MaxEvents = eventsToProcess(nentries, self.Configuration)
+      self.FirstEvent, self.LastEvent = 0, self.MaxEvents
+      if self.EntryRange is not None:
+        self.FirstEvent = self.alignToCluster(self.EntryRange[0])
+        self.LastEvent  = self.alignToCluster(self.EntryRange[1])
+        self.log("Processing entries %d to %d" % (self.FirstEvent, self.LastEvent))
+      self.NEntries = self.LastEvent - self.FirstEvent
+      self.JobStatistics.setMaxEvents(max(self.NEntries, 1))
+
+    # Moves an entry to the start of the next cluster, so that neighbouring entry ranges do not share a cluster
+    def alignToCluster(self, entry):
+      if entry <= 0 or entry >= self.MaxEvents:
+        return min(max(entry, 0), self.MaxEvents)
+      return min(BatchReader.alignToCluster(self.InputTree, entry), self.MaxEvents)
+
+    # Entries failing the Preselection of the configuration are rejected by TTree::Draw in compiled code before the event loop.
+    # All events of the range are counted as "all" beforehand, with their weights, so the cutflow is not changed.
+    def preselectEntries(self, preselection):
+      branches = [b for b in self.formulaBranches(preselection) if b not in self.Analysis.Store.Activated]
+      [self.InputTree.SetBranchStatus(b, 1) for b in branches]
+      with ROOT.TDirectory.TContext(ROOT.gROOT):
+        selected  = self.InputTree.Draw(">>preselection", preselection, "entrylist", self.LastEvent - self.FirstEvent, self.FirstEvent)
+        entryList = ROOT.gROOT.FindObject("preselection")
+      [self.InputTree.SetBranchStatus(b, 0) for b in branches]
+      if selected < 0 or not entryList:
+        raise RuntimeError("Could not evaluate the preselection " + preselection)
+      # the list is taken out of gROOT and deleted with its python reference, so the next job starts from an empty one
+      entryList.SetDirectory(ROOT.nullptr)
+      ROOT.SetOwnership(entryList, True)
+      self.InputTree.SetEntryList(entryList)
+      entries = [self.InputTree.GetEntryNumber(i) for i in range(entryList.GetN())]
+      self.InputTree.SetEntryList(ROOT.nullptr)
+      if not self.Analysis.PreCounted:
+        self.countAllEvents()
+      self.log("Preselection %s: %d of %d events selected" % (preselection, len(entries), self.LastEvent - self.FirstEvent))
+      self.NEntries = len(entries)
+      self.JobStatistics.setMaxEvents(max(self.NEntries, 1))
+      return entries
+
+    def formulaBranches(self, expression):
+      self.InputTree.LoadTree(self.FirstEvent)
+      formula = ROOT.TTreeFormula("formula", expression, self.InputTree.GetTree())
+      if formula.GetNdim() == 0:
+        raise ValueError("Invalid expression " + expression)
+      return sorted(set([formula.GetLeaf(i).GetBranch().GetName() for i in range(formula.GetNcodes())]))
+
+    # A skim only holds the selected events, the "all" count of the original sample is taken from the file instead.
+    # It is added by the job processing the first entries, so it is only counted once if the skim is split.
+    def countSkimmedEvents(self):
+      counts = [metadata.skimCounts() for metadata in self.Metadata]
+      if not any(counts): return
+      if self.FirstEvent == 0:
+        [self.Analysis.EventCounter.updateSums("all", *count) for count in counts if count]
+      self.Analysis.PreCounted = True
+      self.log("Input is a skim, the \"all\" count is taken from the file")
+
+    def countAllEvents(self):
+      nevents = self.LastEvent - self.FirstEvent
+      if self.Analysis.getIsData():
+        self.Analysis.EventCounter.updateSums("all", nevents, float(nevents), float(nevents))
+      else:
+        store = self.Analysis.Store
+        store.activateBranches(store.weightBranches)
+        reader = BatchReader.BatchReader(store)
+        sumOfWeights, sumOfSquaredWeights = 0., 0.
+        for first, last in reader.clusterRanges(self.FirstEvent, self.LastEvent, self.Configuration.get("BatchSize", 10000)):
+          weights = reader.draw([store.weightExpression], first, last, last - first)[0].tolist()
+          # summed one by one in entry order, like the event loop does
+          sumOfWeights        = sum(weights, sumOfWeights)
+          sumOfSquaredWeights = sum([w*w for w in weights], sumOfSquaredWeights)
+        self.Analysis.EventCounter.updateSums("all", nevents, sumOfWeights, sumOfSquaredWeights)
+      self.Analysis.PreCounted = True
+
+    # Remote input files are read from the local file cache if it is enabled
+    def localInputFiles(self, identities):
+      if not self.Configuration.get("FileCache", False):
+        return self.InputFiles
+      self.FileCache = FileCache.FileCache(self.cacheDirectory("files"), float(self.Configuration.get("FileCacheLimit", 50e9)),
+                                           self.Configuration.get("VerifyChecksum", False))
+      return [self.FileCache.localCopy(filename, identity) for filename, identity in zip(self.InputFiles, identities)]
+
+    def cacheDirectory(self, name):
+      return os.path.join(self.Configuration.get("CacheDirectory", "Cache/"), name)
+
+    # The branches used by the analysis are recorded next to the output file and activated right away in later runs
+    def branchListLocation(self):
+      return self.OutputFileLocation + ".branches"
+
+    def readBranchList(self, store):
+      if not os.path.exists(self.branchListLocation()): return False
+      with open(self.branchListLocation()) as branchList:
+        branches = branchList.read().split()
+      store.activateBranches(branches)
+      self.log("Activated %d recorded branches" % len(branches))
+      return True
+
+    def writeBranchList(self, store):
+      with open(self.branchListLocation(), "w") as branchList:
+        branchList.write("\n".join(sorted(store.Activated)) + "\n")
+      self.log("Recorded %d used branches in %s" % (len(store.Activated), self.branchListLocation()))
 
     def log(self, message):
       print(time.ctime() + " Job " + self.Name + ": " + message)
+
+#======================================================================
+
+def eventsToProcess(nentries, configuration):
+    """Number of events of a sample to be analysed according to the MaxEvents and Fraction settings."""
+    return int(min(configuration["MaxEvents"], nentries)*configuration["Fraction"])
               
         
 
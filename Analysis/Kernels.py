@@ -0,0 +1,51 @@
+"""Support for the hot parts of an analysis written in C++ ("kernels"), which are called once per batch of events.
+The source of a kernel library is compiled with ACLiC into a shared library in the cache directory, named after the
+checksum of the source and the ROOT version. Later runs and the other workers of a pool find the library up to date and
+only load it, so the compilation is only done once. Where no compiler is available the source is JIT compiled by cling
+in every process instead.
+The functions are reached through the namespace the source has to define, ROOT.<name>. Pointer arguments accept numpy
+arrays of the matching type, e.g. the columns of a Batch (float -> float32, int -> int32).
+"""
+
+import ROOT
+import hashlib
+import os
+import time
+
+from Analysis import FileCache
+
+# kernel libraries loaded in this process
+loaded = {}
+
+#======================================================================
+
+def load(name, source, directory):
+    """Compiles (once) and loads the kernel library with the given source, which defines the C++ namespace name."""
+    key = hashlib.sha1((source + ROOT.gROOT.GetVersion()).encode()).hexdigest()[:16]
+    if loaded.get(name) == key:
+        return getattr(ROOT, name)
+    if name in loaded:
+        raise RuntimeError("A different kernel library " + name + " is already loaded in this process")
+
+    os.makedirs(directory, exist_ok=True)
+    macro = os.path.join(directory, "%s_%s.C" % (name, key))
+    with FileCache.FileLock(macro + ".lock"):
+        if not os.path.exists(macro):
+            temporary = macro + ".%d.tmp" % os.getpid()
+            with open(temporary, "w") as sourceFile:
+                sourceFile.write(source)
+            os.replace(temporary, macro)
+        start = time.time()
+        # k: keep the library, O: optimise; an up to date library is only loaded
+        compiled = ROOT.gSystem.CompileMacro(macro, "kO") == 1
+    if compiled:
+        log("Loaded %s in %.1fs" % (macro, time.time() - start))
+    else:
+        log("Could not compile %s, falling back to the interpreter" % macro)
+        if not ROOT.gInterpreter.Declare(source):
+            raise RuntimeError("Could not compile the kernel library " + name)
+    loaded[name] = key
+    return getattr(ROOT, name)
+
+def log(message):
+    print(time.ctime() + " Kernels: " + message)
@@ -0,0 +1,76 @@
+"""Four-vector kinematics on numpy arrays of (pt, eta, phi, E), as an alternative to building a ROOT.TLorentzVector
+per object. All functions accept scalars as well as arrays of any shape and follow the conventions of TLorentzVector,
+so the results agree with it to floating point precision:
+    M()          of a four-vector with negative mass squared is -sqrt(-m2)
+    DeltaPhi()   is mapped into [-pi, pi)
+    Eta()        of a vector along the beam axis is +-10e10
+Functions summing several objects (massOfSystem, ...) add up the four-vectors along the given axis,
+e.g. the leptons of an (events, 4) array.
+"""
+
+import numpy
+
+#======================================================================
+
+# Conversions
+def cartesian(pt, eta, phi, e):
+    """Returns px, py, pz, E."""
+    pt = numpy.asarray(pt, dtype=numpy.float64)
+    return pt*numpy.cos(phi), pt*numpy.sin(phi), pt*numpy.sinh(eta), numpy.asarray(e, dtype=numpy.float64)
+
+def transverseMomentum(px, py):
+    return numpy.hypot(px, py)
+
+def azimuth(px, py):
+    return numpy.arctan2(py, px)
+
+def pseudorapidity(px, py, pz):
+    p = numpy.sqrt(px*px + py*py + pz*pz)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        cosTheta = numpy.where(p > 0, pz/numpy.where(p > 0, p, 1), 1)
+        eta = -0.5*numpy.log((1 - cosTheta)/(1 + cosTheta))
+    alongBeam = cosTheta*cosTheta >= 1
+    return numpy.where(alongBeam, numpy.where(pz == 0, 0., numpy.where(pz > 0, 10e10, -10e10)), eta)
+
+# Single four-vectors
+def invariantMass(px, py, pz, e):
+    mm = e*e - (px*px + py*py + pz*pz)
+    return numpy.where(mm < 0, -numpy.sqrt(numpy.abs(mm)), numpy.sqrt(numpy.abs(mm)))
+
+def deltaPhi(phi1, phi2):
+    """phi1 - phi2 mapped into [-pi, pi)."""
+    return numpy.mod(numpy.asarray(phi1, dtype=numpy.float64) - phi2 + numpy.pi, 2*numpy.pi) - numpy.pi
+
+def deltaR(eta1, phi1, eta2, phi2):
+    return numpy.hypot(numpy.asarray(eta1, dtype=numpy.float64) - eta2, deltaPhi(phi1, phi2))
+
+def transverseMass(pt1, phi1, pt2, phi2):
+    """Transverse mass of two massless objects, e.g. a lepton and the missing transverse momentum."""
+    return numpy.sqrt(2*numpy.asarray(pt1, dtype=numpy.float64)*pt2*(1 - numpy.cos(deltaPhi(phi1, phi2))))
+
+# Systems of several objects
+def sumOfVectors(pt, eta, phi, e, axis = -1):
+    """Sums the four-vectors along axis and returns px, py, pz, E of the sum."""
+    return tuple(component.sum(axis=axis) for component in cartesian(pt, eta, phi, e))
+
+def massOfSystem(pt, eta, phi, e, axis = -1):
+    return invariantMass(*sumOfVectors(pt, eta, phi, e, axis))
+
+def massOfPair(pt1, eta1, phi1, e1, pt2, eta2, phi2, e2):
+    px1, py1, pz1, e1 = cartesian(pt1, eta1, phi1, e1)
+    px2, py2, pz2, e2 = cartesian(pt2, eta2, phi2, e2)
+    return invariantMass(px1 + px2, py1 + py2, pz1 + pz2, e1 + e2)
+
+# Lorentz boosts
+def boostVector(px, py, pz, e):
+    """Velocity of a four-vector, boosting by minus this vector brings an object into its rest frame."""
+    return px/e, py/e, pz/e
+
+def boost(px, py, pz, e, bx, by, bz):
+    """Boosts the four-vectors by the velocity (bx, by, bz), like TLorentzVector::Boost, and returns px, py, pz, E."""
+    b2    = bx*bx + by*by + bz*bz
+    gamma = 1.0/numpy.sqrt(1.0 - b2)
+    bp    = bx*px + by*py + bz*pz
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        gamma2 = numpy.where(b2 > 0, (gamma - 1.0)/numpy.where(b2 > 0, b2, 1), 0.0)
+    return px + gamma2*bp*bx + gamma*bx*e, py + gamma2*bp*by + gamma*by*e, pz + gamma2*bp*bz + gamma*bz*e, gamma*(e + bp)
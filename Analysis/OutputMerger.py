@@ -0,0 +1,121 @@
+"""Merging of the partial output files written by jobs that process a part of a sample.
+The partial files of each sample are merged in a tree reduction: in every round the files are merged pairwise, every pair
+as a task of its own on the worker pool, halving their number until a single file is left, which then takes the place of the
+usual <OutputDirectory>/<process>.root. The rounds of a sample are started as soon as the previous round of this sample is
+done, independently of the other samples, so a sample can be merged while the jobs of other samples are still running.
+A pair of files is merged object by object, so only the histograms with one name are held in memory at a time.
+The partial files are removed once they are merged.
+The event counters of the parts are combined in the same pairwise fashion.
+"""
+
+import ROOT
+import os
+
+from Analysis import EventCounter
+
+#======================================================================
+
+def mergeOutputs(outputs, pool = None):
+    """outputs maps the name of each final output file to the list of its partial files."""
+    merger = OutputMerger(pool)
+    [merger.add(output, parts) for output, parts in sorted(outputs.items())]
+    merger.wait()
+
+#======================================================================
+
+class OutputMerger(object):
+    """Runs the tree reductions of the outputs added to it on the pool. Rounds are started by poll() and wait(), which are
+    called by the process owning the pool. Without a pool the pairs are merged right away, one after the other."""
+    def __init__(self, pool = None):
+        super(OutputMerger, self).__init__()
+        self.Pool    = pool
+        # output -> (round, parts), a part is a file or the AsyncResult of the merging that writes it
+        self.Pending = {}
+
+    def add(self, output, parts):
+        self.Pending[output] = (0, list(parts))
+        self.advance(output)
+
+    def poll(self):
+        [self.advance(output) for output in sorted(self.Pending)]
+
+    def wait(self):
+        while self.Pending:
+            self.poll()
+            running = [part for level, parts in self.Pending.values() for part in parts if not isinstance(part, str)]
+            if running:
+                running[0].wait(0.1)
+
+    # Starts the next round of an output once its current round is done
+    def advance(self, output):
+        level, parts = self.Pending[output]
+        if any([not isinstance(part, str) and not part.ready() for part in parts]): return
+        parts = [part if isinstance(part, str) else part.get() for part in parts]
+        if len(parts) == 1:
+            os.replace(parts[0], output)
+            del self.Pending[output]
+            return
+        base  = output[:-len(".root")] if output.endswith(".root") else output
+        tasks = [(parts[i], parts[i+1], "%s.merge%d_%d.root" % (base, level, i//2)) for i in range(0, len(parts) - 1, 2)]
+        if self.Pool is None:
+            merged = [mergePair(task) for task in tasks]
+        else:
+            merged = [self.Pool.apply_async(mergePair, (task,)) for task in tasks]
+        self.Pending[output] = (level + 1, merged + (parts[-1:] if len(parts) % 2 else []))
+        if self.Pool is None:
+            self.advance(output)
+
+#======================================================================
+
+def mergePair(task):
+    """Merges two files into a new one and removes the two inputs."""
+    first, second, output = task
+    with ROOT.TDirectory.TContext():
+        inputs = [ROOT.TFile.Open(first, "READ"), ROOT.TFile.Open(second, "READ")]
+        merged = ROOT.TFile.Open(output, "RECREATE")
+        for name in objectNames(inputs):
+            objects = [readObject(inputFile, name) for inputFile in inputs]
+            result  = mergeObjects(name, [obj for obj in objects if obj is not None])
+            merged.WriteTObject(result, name)
+        merged.Close()
+        [inputFile.Close() for inputFile in inputs]
+    os.remove(first)
+    os.remove(second)
+    return output
+
+def mergeCounters(counters):
+    """Adds up the event counters of the parts of a sample pairwise and returns the combined counter."""
+    counters = list(counters)
+    while len(counters) > 1:
+        [counters[i].add(counters[i+1]) for i in range(0, len(counters) - 1, 2)]
+        counters = counters[::2]
+    return counters[0]
+
+#======================================================================
+
+def objectNames(files):
+    """Names of all objects in the files, in the order of their first appearance."""
+    names = []
+    for inputFile in files:
+        names += [key.GetName() for key in inputFile.GetListOfKeys() if key.GetName() not in names]
+    return names
+
+def readObject(inputFile, name):
+    if not inputFile.GetListOfKeys().FindObject(name):
+        return None
+    obj = inputFile.Get(name)
+    # histograms are detached from the file and owned by python, so they are deleted as soon as they are written
+    if isinstance(obj, ROOT.TH1):
+        obj.SetDirectory(ROOT.nullptr)
+        ROOT.SetOwnership(obj, True)
+    return obj
+
+def mergeObjects(name, objects):
+    """Histograms are summed, cutflows according to their bin labels. For all other objects the first one is kept."""
+    result = objects[0]
+    if name in [EventCounter.cutflowName, EventCounter.rawCutflowName]:
+        for obj in objects[1:]:
+            result = EventCounter.addCutflows(result, obj)
+    elif isinstance(result, ROOT.TH1):
+        [result.Add(obj) for obj in objects[1:]]
+    return result
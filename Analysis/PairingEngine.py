@@ -0,0 +1,72 @@
+"""The PairingEngine finds the best way of arranging N objects into two pairs, e.g. the two Z boson candidates of a
+four lepton event. All assignments of two disjoint pairs are enumerated once per N, so an event only has to provide one
+score per pair (e.g. |m_ll - m_Z|) and whether the pair is allowed (e.g. same flavour, opposite sign).
+The best assignment is the one with the lowest sum of its two pair scores.
+
+An assignment (a, b, c, d) pairs a with b and c with d. Only the canonical ordering a < b, c < d, a < c of every
+assignment is kept, and the assignments are ordered lexicographically. Among assignments with equal scores the first
+one is chosen, which is the same one a loop over itertools.permutations(objects, 4) with a strict comparison finds.
+"""
+
+import itertools
+import numpy
+
+#======================================================================
+
+class PairingEngine(object):
+    """Assignments of N objects into two pairs. Use getEngine(n) to share the engines between events."""
+    def __init__(self, nObjects):
+        super(PairingEngine, self).__init__()
+        self.NObjects    = nObjects
+        self.Pairs       = list(itertools.combinations(range(nObjects), 2))
+        self.PairIndex   = dict((pair, i) for i, pair in enumerate(self.Pairs))
+        self.Assignments = [p for p in itertools.permutations(range(nObjects), 4) if p[0] < p[1] and p[2] < p[3] and p[0] < p[2]]
+        self.AssignmentPairs = [(self.PairIndex[p[:2]], self.PairIndex[p[2:]]) for p in self.Assignments]
+
+        # array versions for batches
+        self.PairArray           = numpy.array(self.Pairs, dtype=numpy.int64).reshape((-1, 2))
+        self.AssignmentArray     = numpy.array(self.Assignments, dtype=numpy.int64).reshape((-1, 4))
+        self.AssignmentPairArray = numpy.array(self.AssignmentPairs, dtype=numpy.int64).reshape((-1, 2))
+
+    # Single events
+    def bestAssignment(self, pairScores, pairValid):
+        """pairScores and pairValid hold one entry per pair in the order of self.Pairs.
+        Returns the best assignment as a tuple of object indices, None if no assignment of two valid pairs exists."""
+        best, bestScore = None, None
+        for assignment, (first, second) in zip(self.Assignments, self.AssignmentPairs):
+            if not (pairValid[first] and pairValid[second]): continue
+            score = pairScores[first] + pairScores[second]
+            if best is None or score < bestScore:
+                best, bestScore = assignment, score
+        return best
+
+    # Batches of events
+    def pairValues(self, values):
+        """Splits an (events, N) array into the values of the first and the second object of every pair, each (events, pairs)."""
+        return values[:, self.PairArray[:, 0]], values[:, self.PairArray[:, 1]]
+
+    def bestAssignments(self, pairScores, pairValid):
+        """pairScores and pairValid are (events, pairs) arrays. Returns the index of the best assignment of every event
+        into self.AssignmentArray, -1 for events without an assignment of two valid pairs."""
+        if len(self.Assignments) == 0:
+            return numpy.full(len(pairScores), -1, dtype=numpy.int64)
+        first, second = self.AssignmentPairArray[:, 0], self.AssignmentPairArray[:, 1]
+        scores = pairScores[:, first] + pairScores[:, second]
+        valid  = pairValid[:, first] & pairValid[:, second]
+        scores = numpy.where(valid, scores, numpy.inf)
+        best   = numpy.argmin(scores, axis=1)
+        return numpy.where(valid.any(axis=1), best, -1)
+
+    def assignedObjects(self, best):
+        """Object indices (events, 4) of the chosen assignments, -1 for events without one."""
+        objects = self.AssignmentArray[numpy.maximum(best, 0)] if len(self.Assignments) else numpy.zeros((len(best), 4), dtype=numpy.int64)
+        return numpy.where((best >= 0)[:, numpy.newaxis], objects, -1)
+
+#======================================================================
+
+engines = {}
+
+def getEngine(nObjects):
+    if nObjects not in engines:
+        engines[nObjects] = PairingEngine(nObjects)
+    return engines[nObjects]
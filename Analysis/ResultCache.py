@@ -0,0 +1,81 @@
+"""Outputs of earlier runs are reused if nothing they depend on changed. The key of a result is a checksum of
+    the source of the analysis module and of Job.py, together with all modules of Analysis/ they import (found by parsing the sources)
+    the settings of the Job configuration that may change the result
+    the identity (location, size, modification time) of the input file and the ROOT version
+The key is stored in the output file as a TNamed "ResultKey" once the sample is complete. A sample whose output holds the
+key of the current run does not need to be processed again.
+"""
+
+import ROOT
+import ast
+import hashlib
+import json
+import os
+
+# settings that only change how the result is computed, not the result
+technicalSettings = ["Batch", "OutputDirectory", "CacheDirectory", "FileCache", "FileCacheLimit", "PrefetchLimit", "VerifyChecksum",
+                     "TreeCacheSize", "TreeCacheLearnEntries", "AsyncPrefetching", "BatchSize", "HistogramBuffer", "RecordBranches",
+                     "Threads", "ColumnCache", "ResultCache"]
+
+# checksums of the code, determined once per analysis
+codeChecksums = {}
+
+#======================================================================
+
+def resultKey(configuration, identity):
+    """Key of the result of the analysis of the configuration for the input file with the given identity (see FileMetadata.fileIdentity)."""
+    content = {
+        "code"          : codeChecksum(configuration["Analysis"]),
+        "configuration" : dict((name, value) for name, value in configuration.items() if name not in technicalSettings),
+        "input"         : identity,
+        "root"          : ROOT.gROOT.GetVersion(),
+    }
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+def codeChecksum(analysisName):
+    if analysisName not in codeChecksums:
+        sources = moduleSources([analysisName, "Job"])
+        codeChecksums[analysisName] = hashlib.sha1("".join(name + "\n" + sources[name] for name in sorted(sources)).encode()).hexdigest()
+    return codeChecksums[analysisName]
+
+def moduleSources(names):
+    """Sources of the given modules of Analysis/ and of all modules of Analysis/ they import, directly or indirectly."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    sources   = {}
+    pending   = list(names)
+    while pending:
+        name = pending.pop()
+        location = os.path.join(directory, name + ".py")
+        if name in sources or not os.path.exists(location): continue
+        with open(location) as sourceFile:
+            sources[name] = sourceFile.read()
+        pending += importedModules(sources[name])
+    return sources
+
+def importedModules(source):
+    modules = []
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.ImportFrom) and node.module == "Analysis":
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and node.module.startswith("Analysis."):
+            modules.append(node.module.split(".")[1])
+        elif isinstance(node, ast.Import):
+            modules += [alias.name.split(".")[1] for alias in node.names if alias.name.startswith("Analysis.")]
+    return modules
+
+# The key is kept in the output file
+def storedKey(output):
+    if not os.path.exists(output): return None
+    with ROOT.TDirectory.TContext():
+        outputFile = ROOT.TFile.Open(output, "READ")
+        if not outputFile or outputFile.IsZombie(): return None
+        stored = outputFile.Get("ResultKey")
+        key = stored.GetTitle() if stored else None
+        outputFile.Close()
+    return key
+
+def stamp(output, key):
+    with ROOT.TDirectory.TContext():
+        outputFile = ROOT.TFile.Open(output, "UPDATE")
+        outputFile.WriteTObject(ROOT.TNamed("ResultKey", key), "ResultKey", "Overwrite")
+        outputFile.Close()
@@ -0,0 +1,48 @@
+import ROOT
+import os
+import time
+
+from Analysis import EventCounter
+
+#======================================================================
+
+class SkimWriter(object):
+    """Collects the entries selected by an analysis and writes them to a reduced mini tree that only holds the branches
+    the analysis activated. The branches keep their names and types, so the TupleReader reads the skim like the original
+    file and it can be used as the input of a process. The "all" count of the original sample is stored next to the tree
+    as a cutflow with a single bin (see EventCounter.writeResults), jobs reading the skim start from it.
+    """
+    def __init__(self, location):
+        super(SkimWriter, self).__init__()
+        self.Location = location
+        self.Entries  = []
+
+    def add(self, entry):
+        self.Entries.append(entry)
+
+    def addEntries(self, entries):
+        self.Entries.extend(entries)
+
+    # Besides the activated branches the given extra branches are copied
+    def write(self, tree, eventCounter, extraBranches = []):
+        os.makedirs(os.path.dirname(self.Location) or ".", exist_ok=True)
+        with ROOT.TDirectory.TContext(ROOT.gROOT):
+            entryList = ROOT.TEntryList("skim", "skim")
+            [entryList.Enter(entry, tree) for entry in self.Entries]
+        with ROOT.TDirectory.TContext():
+            skimFile = ROOT.TFile.Open(self.Location, "RECREATE")
+            # only the activated branches are copied
+            [tree.SetBranchStatus(branch, 1) for branch in extraBranches]
+            tree.SetEntryList(entryList)
+            skim = tree.CopyTree("")
+            tree.SetEntryList(ROOT.nullptr)
+            skim.Write()
+            nbranches = skim.GetNbranches()
+            counter = EventCounter.EventCounter(eventCounter.Name)
+            counter.updateSums("all", eventCounter.RawCounter["all"], eventCounter.WeightedCounter["all"], eventCounter.SquaredWeightCounter["all"])
+            counter.writeResults()
+            skimFile.Close()
+        self.log("Wrote %d of %d events with %d branches to %s" % (len(self.Entries), eventCounter.RawCounter["all"], nbranches, self.Location))
+
+    def log(self, message):
+        print(time.ctime() + " SkimWriter: " + message)
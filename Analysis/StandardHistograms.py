@@ -96,3 +96,23 @@ def getStandardHistogram(name):
     if (name == "Topmass"):           return ROOT.TH1D("Topmass",           "Mass of three jets;m_{jjj}^{max p_{T}} [GeV];Events", 40, 0, 300);
     
     return None
+
+# Books the histograms shared by the HZZ analyses (HZZAnalysis, HZZKernelAnalysis, HZZDataFrameAnalysis) as attributes of the analysis
+def addHZZHistograms(analysis):
+    analysis.invMassZ1         = analysis.addHistogram("invMassZ1",         ROOT.TH1D("invMassZ1",         "Invariant Mass of the Z boson 1;M_{Z1} [GeV]; Events", 30, 50,106))
+    analysis.invMassZ2         = analysis.addHistogram("invMassZ2",         ROOT.TH1D("invMassZ2",         "Invariant Mass of the Z boson 2;M_{Z2} [GeV]; Events", 30, 60,120))
+    analysis.mass_four_lep_ext = analysis.addHistogram("mass_four_lep_ext", ROOT.TH1D("mass_four_lep_ext", "Invariant Mass of the 4-lepton system;M_{4l} [GeV]; Events",30,80,250))
+
+    analysis.hist_leptn        = analysis.addStandardHistogram("lep_n")
+    analysis.hist_leptpt       = analysis.addStandardHistogram("lep_pt")
+    analysis.hist_lepteta      = analysis.addStandardHistogram("lep_eta")
+    analysis.hist_leptE        = analysis.addStandardHistogram("lep_E")
+    analysis.hist_leptphi      = analysis.addStandardHistogram("lep_phi")
+    analysis.hist_leptch       = analysis.addStandardHistogram("lep_charge")
+    analysis.hist_leptID       = analysis.addStandardHistogram("lep_type")
+    analysis.hist_leptptc      = analysis.addStandardHistogram("lep_ptconerel30")
+    analysis.hist_leptetc      = analysis.addStandardHistogram("lep_etconerel20")
+    analysis.hist_lepz0        = analysis.addStandardHistogram("lep_z0")
+    analysis.hist_lepd0        = analysis.addStandardHistogram("lep_d0")
+
+    analysis.hist_etmiss       = analysis.addStandardHistogram("etmiss")
@@ -1,152 +1,262 @@
 import ROOT
+import numpy
 from array import array
 
+from Analysis import BatchReader
+
 #======================================================================
 
 class TupleReader(object):
     """ This class implements the rules that govern the readout of the ROOT tuples and and provide a caching facility.
     Caching improves the readout by eliminating the need for branch address lookup each time the variable is accessed.
+    Branches are activated lazily: a branch is only switched on and bound to its datamember the first time the datamember is accessed.
     """
 
     def __init__(self):
         super(TupleReader, self).__init__()
         self.Tree = None
+        self.Metadata     = []
+        self.Activated    = {}
+        self.Declarations = {}
+        self.Collections  = {}
+        self.Maxima       = {}
+        self.Views        = {}
+        self.BranchNames  = {}
+        self.Arrays       = {}
+        self.Derived      = EntryCache({})
+        self.Staged       = None
+        self.Branches     = {}
+        self.TreeNumber   = -1
         
     def initializeTuple(self,tree):
-        """The initial setup of the caching is done here. Branches in the TTree may be deactivated using SetBranchStatus to
-        increase readout speed. Only necessary branches are activated and their contents are bound to datamembers of the
-        tuple reader.
+        """The initial setup of the caching is done here. All branches in the TTree are deactivated using SetBranchStatus to
+        increase readout speed. The branches that may be read are declared together with the datamember of the tuple reader
+        they will be bound to. A declared branch only gets activated (and decompressed for every event) once its datamember
+        is used, so analyses only pay for the branches they actually read.
         """
         self.Tree = tree
         self.Tree.SetBranchStatus("*",0)
+        self.Activated    = {}
+        self.Declarations = {}
+        self.Collections  = {}
+        self.Maxima       = {}
+        self.Views        = {}
+        self.BranchNames  = {}
+        self.Arrays       = {}
+        self.Derived      = EntryCache({})
+        self.Staged       = None
+        self.Branches     = {}
+        self.TreeNumber   = -1
 
         #EventInfo 
-        #self.eventNumber      = self.activate("i", "eventNumber",            1)
-        #self.runNumber        = self.activate("i", "runNumber" ,             1)
-        self.mcWeight         = self.activate("f", "mcWeight",               1)
-        #self.channelNumber    = self.activate("i", "channelNumber",          1)
-                                                                             
-        self.trigE            = self.activate("b", "trigE",                     1)
-        self.trigM            = self.activate("b", "trigM",                     1)
-        #self.trigP            = self.activate("b", "trigP",                     1)
-        self.SF_Pileup        = self.activate("f", "scaleFactor_PILEUP",        1)
-        self.SF_Ele           = self.activate("f", "scaleFactor_ELE",           1)
-        self.SF_Mu            = self.activate("f", "scaleFactor_MUON",          1)
-        self.SF_Photon        = self.activate("f", "scaleFactor_PHOTON",        1)
-        self.SF_Tau           = self.activate("f", "scaleFactor_TAU",           1)
-        #self.SF_BTag          = self.activate("f", "scaleFactor_BTAG",          1)
-        self.SF_LepTrigger    = self.activate("f", "scaleFactor_LepTRIGGER",    1) 
-        self.SF_PhotonTrigger = self.activate("f", "scaleFactor_PhotonTRIGGER", 1)
-        #self.XSection         = self.activate("f", "XSection",                  1)
-        #self.SumWeights       = self.activate("f", "SumWeights",                1)
+        self.declare("eventNumber",      "i", "eventNumber")
+        self.declare("runNumber",        "i", "runNumber")
+        self.declare("mcWeight",         "f", "mcWeight")
+        self.declare("channelNumber",    "i", "channelNumber")
+
+        self.declare("trigE",            "b", "trigE")
+        self.declare("trigM",            "b", "trigM")
+        self.declare("trigP",            "b", "trigP")
+        self.declare("SF_Pileup",        "f", "scaleFactor_PILEUP")
+        self.declare("SF_Ele",           "f", "scaleFactor_ELE")
+        self.declare("SF_Mu",            "f", "scaleFactor_MUON")
+        self.declare("SF_Photon",        "f", "scaleFactor_PHOTON")
+        self.declare("SF_Tau",           "f", "scaleFactor_TAU")
+        self.declare("SF_BTag",          "f", "scaleFactor_BTAG")
+        self.declare("SF_LepTrigger",    "f", "scaleFactor_LepTRIGGER")
+        self.declare("SF_PhotonTrigger", "f", "scaleFactor_PhotonTRIGGER")
+        self.declare("XSection",         "f", "XSection")
+        self.declare("SumWeights",       "f", "SumWeights")
 
         self.EventInfo = EventInfo(self)
-        
+
 
         #LeptonInfo
-        max_Lep = self.GetMaximum("lep_n")
-        max_Lep = min(abs(max_Lep), 20)
-        self.Lep_n          = self.activate("i", "lep_n",                    1)
-        self.Lep_pt         = self.activate("f", "lep_pt",                   max_Lep) 
-        self.Lep_eta        = self.activate("f", "lep_eta",                  max_Lep) 
-        self.Lep_phi        = self.activate("f", "lep_phi",                  max_Lep)
-        self.Lep_e          = self.activate("f", "lep_E",                    max_Lep)
-        self.Lep_pdgid      = self.activate("i", "lep_type",                 max_Lep)
-        self.Lep_charge     = self.activate("i", "lep_charge",               max_Lep)
-        self.Lep_ptcone30   = self.activate("f", "lep_ptcone30",             max_Lep)
-        self.Lep_etcone20   = self.activate("f", "lep_etcone20",             max_Lep)                    
-        #self.Lep_d0         = self.activate("f", "lep_trackd0pvunbiased",    max_Lep)
-        #self.Lep_d0Sig      = self.activate("f", "lep_tracksigd0pvunbiased", max_Lep)
-        #self.Lep_trigMatch  = self.activate("b", "lep_trigMatched",          max_Lep)
-        #self.Lep_truthMatch = self.activate("b", "lep_truthMatched",         max_Lep)
-        #self.Lep_z0         = self.activate("f", "lep_z0",                   max_Lep)
-        #self.Lep_isTightID  = self.activate("b", "lep_isTightID",            max_Lep)
-        #self.Lep_pt_syst    = self.activate("f", "lep_pt_syst",              max_Lep)
-
-        self.Leptons = [Lepton(i,self) for i in range(0,max_Lep)]
-
-        ''' 
+        self.declare("Lep_n",          "i", "lep_n")
+        self.declare("Lep_pt",         "f", "lep_pt",                   "lep_n")
+        self.declare("Lep_eta",        "f", "lep_eta",                  "lep_n")
+        self.declare("Lep_phi",        "f", "lep_phi",                  "lep_n")
+        self.declare("Lep_e",          "f", "lep_E",                    "lep_n")
+        self.declare("Lep_pdgid",      "i", "lep_type",                 "lep_n")
+        self.declare("Lep_charge",     "i", "lep_charge",               "lep_n")
+        self.declare("Lep_ptcone30",   "f", "lep_ptcone30",             "lep_n")
+        self.declare("Lep_etcone20",   "f", "lep_etcone20",             "lep_n")
+        self.declare("Lep_d0",         "f", "lep_trackd0pvunbiased",    "lep_n")
+        self.declare("Lep_d0Sig",      "f", "lep_tracksigd0pvunbiased", "lep_n")
+        self.declare("Lep_trigMatch",  "b", "lep_trigMatched",          "lep_n")
+        self.declare("Lep_truthMatch", "b", "lep_truthMatched",         "lep_n")
+        self.declare("Lep_z0",         "f", "lep_z0",                   "lep_n")
+        self.declare("Lep_isTightID",  "b", "lep_isTightID",            "lep_n")
+        self.declare("Lep_pt_syst",    "f", "lep_pt_syst",              "lep_n")
+
+        self.declareCollection("Leptons", Lepton, "lep_n", {
+            "pt"             : lambda: self.scaled("Lep_pt", 0.001),
+            "eta"            : lambda: self.entryValues("Lep_eta"),
+            "phi"            : lambda: self.entryValues("Lep_phi"),
+            "e"              : lambda: self.scaled("Lep_e", 0.001),
+            "isTightID"      : lambda: self.entryValues("Lep_isTightID"),
+            "pdgId"          : lambda: self.entryValues("Lep_pdgid"),
+            "charge"         : lambda: self.entryValues("Lep_charge"),
+            "isoptconerel30" : lambda: self.ratio("Lep_ptcone30", "Lep_pt"),
+            "isoetconerel20" : lambda: self.ratio("Lep_etcone20", "Lep_pt"),
+        })
+
+
         #JetInfo
-        max_Jet = self.GetMaximum("jet_n")
-        max_Jet = min(abs(max_Jet), 20)
-        self.Jet_n            = self.activate("i", "jet_n",            1)
-        self.Jet_pt           = self.activate("f", "jet_pt",           max_Jet)
-        self.Jet_eta          = self.activate("f", "jet_eta",          max_Jet)
-        self.Jet_e            = self.activate("f", "jet_E",            max_Jet)
-        self.Jet_phi          = self.activate("f", "jet_phi",          max_Jet)
-        self.Jet_jvt          = self.activate("f", "jet_jvt",          max_Jet)
-        self.Jet_trueflav     = self.activate("i", "jet_trueflav",     max_Jet)
-        self.Jet_truthMatched = self.activate("b", "jet_truthMatched", max_Jet)
-        self.Jet_mv2c10       = self.activate("f", "jet_MV2c10",       max_Jet) 
-        self.Jet_pt_syst      = self.activate("f", "jet_pt_syst",      max_Jet)
-         
-        self.Jets = [Jet(i, self) for i in range(0,max_Jet)]
+        self.declare("Jet_n",            "i", "jet_n")
+        self.declare("Jet_pt",           "f", "jet_pt",           "jet_n")
+        self.declare("Jet_eta",          "f", "jet_eta",          "jet_n")
+        self.declare("Jet_e",            "f", "jet_E",            "jet_n")
+        self.declare("Jet_phi",          "f", "jet_phi",          "jet_n")
+        self.declare("Jet_jvt",          "f", "jet_jvt",          "jet_n")
+        self.declare("Jet_trueflav",     "i", "jet_trueflav",     "jet_n")
+        self.declare("Jet_truthMatched", "b", "jet_truthMatched", "jet_n")
+        self.declare("Jet_mv2c10",       "f", "jet_MV2c10",       "jet_n")
+        self.declare("Jet_pt_syst",      "f", "jet_pt_syst",      "jet_n")
+
+        self.declareCollection("Jets", Jet, "jet_n", {
+            "pt"  : lambda: self.scaled("Jet_pt", 0.001),
+            "eta" : lambda: self.entryValues("Jet_eta"),
+            "phi" : lambda: self.entryValues("Jet_phi"),
+            "e"   : lambda: self.scaled("Jet_e", 0.001),
+            "jvt" : lambda: self.entryValues("Jet_jvt"),
+        })
 
 
         #EtMissInfo
-        self.Met_et      = self.activate( "f", "met_et",      1)
-        self.Met_phi     = self.activate( "f", "met_phi",     1)
-        self.Met_et_syst = self.activate( "f", "met_et_syst", 1)
+        self.declare("Met_et",      "f", "met_et")
+        self.declare("Met_phi",     "f", "met_phi")
+        self.declare("Met_et_syst", "f", "met_et_syst")
 
         self.EtMiss = EtMiss(self)
 
 
         #PhotonInfo
-        max_Photon = self.GetMaximum("photon_n")
-        max_Photon = min(abs(max_Photon), 20)
-        self.Photon_n          = self.activate("i", "photon_n",            1)
-        self.Photon_truthMatch = self.activate("b", "photon_truthMatched", max_Photon)
-        self.Photon_trigMatch  = self.activate("b", "photon_trigMatched",  max_Photon)
-        self.Photon_pt         = self.activate("f", "photon_pt",           max_Photon)
-        self.Photon_eta        = self.activate("f", "photon_eta",          max_Photon)
-        self.Photon_phi        = self.activate("f", "photon_phi",          max_Photon)
-        self.Photon_e          = self.activate("f", "photon_E",            max_Photon)
-        self.Photon_isTightID  = self.activate("b", "photon_isTightID",    max_Photon)
-        self.Photon_ptcone30   = self.activate("f", "photon_ptcone30",     max_Photon)
-        self.Photon_etcone20   = self.activate("f", "photon_etcone20",     max_Photon)
-        self.Photon_convType   = self.activate("i", "photon_convType",     max_Photon)
-        self.Photon_pt_syst    = self.activate("f", "photon_pt_syst",      max_Photon)
-
-        self.Photons = [Photon(i,self) for i in range(0,max_Photon)]
+        self.declare("Photon_n",          "i", "photon_n")
+        self.declare("Photon_truthMatch", "b", "photon_truthMatched", "photon_n")
+        self.declare("Photon_trigMatch",  "b", "photon_trigMatched",  "photon_n")
+        self.declare("Photon_pt",         "f", "photon_pt",           "photon_n")
+        self.declare("Photon_eta",        "f", "photon_eta",          "photon_n")
+        self.declare("Photon_phi",        "f", "photon_phi",          "photon_n")
+        self.declare("Photon_e",          "f", "photon_E",            "photon_n")
+        self.declare("Photon_isTightID",  "b", "photon_isTightID",    "photon_n")
+        self.declare("Photon_ptcone30",   "f", "photon_ptcone30",     "photon_n")
+        self.declare("Photon_etcone20",   "f", "photon_etcone20",     "photon_n")
+        self.declare("Photon_convType",   "i", "photon_convType",     "photon_n")
+        self.declare("Photon_pt_syst",    "f", "photon_pt_syst",      "photon_n")
+
+        self.declareCollection("Photons", Photon, "photon_n", {
+            "pt"             : lambda: self.scaled("Photon_pt", 0.001),
+            "eta"            : lambda: self.entryValues("Photon_eta"),
+            "phi"            : lambda: self.entryValues("Photon_phi"),
+            "e"              : lambda: self.scaled("Photon_e", 0.001),
+            "isTightID"      : lambda: self.entryValues("Photon_isTightID"),
+            "isoptconerel30" : lambda: self.ratio("Photon_ptcone30", "Photon_pt"),
+            "isoetconerel20" : lambda: self.ratio("Photon_etcone20", "Photon_pt"),
+        })
 
 
         #TauInfo
-        max_Tau = self.GetMaximum("tau_n")
-        max_Tau = min(abs(max_Tau), 20)
-        self.Tau_n         = self.activate("i", "tau_n",         1)
-        self.Tau_pt        = self.activate("f", "tau_pt",        max_Tau)
-        self.Tau_eta       = self.activate("f", "tau_eta",       max_Tau)
-        self.Tau_e         = self.activate("f", "tau_E",         max_Tau)
-        self.Tau_phi       = self.activate("f", "tau_phi",       max_Tau)
-        self.Tau_isTightID = self.activate("b", "tau_isTightID", max_Tau)
-        self.Tau_nTracks   = self.activate("i", "tau_nTracks",   max_Tau)
-        self.Tau_BDTid     = self.activate("f", "tau_BDTid",     max_Tau)
-        self.Tau_pt_syst   = self.activate("f", "tau_pt_syst",   max_Tau)
-        self.Tau_charge    = self.activate("i", "tau_charge",    max_Tau)
-        self.DiTau_m       = self.activate("f", "ditau_m",       1)
-
-        self.Taus = [Tau(i,self) for i in range(0,max_Tau)]
+        self.declare("Tau_n",         "i", "tau_n")
+        self.declare("Tau_pt",        "f", "tau_pt",        "tau_n")
+        self.declare("Tau_eta",       "f", "tau_eta",       "tau_n")
+        self.declare("Tau_e",         "f", "tau_E",         "tau_n")
+        self.declare("Tau_phi",       "f", "tau_phi",       "tau_n")
+        self.declare("Tau_isTightID", "b", "tau_isTightID", "tau_n")
+        self.declare("Tau_nTracks",   "i", "tau_nTracks",   "tau_n")
+        self.declare("Tau_BDTid",     "f", "tau_BDTid",     "tau_n")
+        self.declare("Tau_pt_syst",   "f", "tau_pt_syst",   "tau_n")
+        self.declare("Tau_charge",    "i", "tau_charge",    "tau_n")
+        self.declare("DiTau_m",       "f", "ditau_m")
+
+        self.declareCollection("Taus", Tau, "tau_n", {
+            "pt"        : lambda: self.scaled("Tau_pt", 0.001),
+            "eta"       : lambda: self.entryValues("Tau_eta"),
+            "phi"       : lambda: self.entryValues("Tau_phi"),
+            "e"         : lambda: self.scaled("Tau_e", 0.001),
+            "isTightID" : lambda: self.entryValues("Tau_isTightID"),
+            "charge"    : lambda: self.entryValues("Tau_charge"),
+        })
 
 
         # largeRjet Info
-        max_largeRjet = self.GetMaximum("largeRjet_n")
-        max_largeRjet = min(abs(max_largeRjet), 20)
-        self.largeRjet_n             = self.activate("i", "largeRjet_n",            1)
-        self.largeRjet_pt            = self.activate("f", "largeRjet_pt",           max_largeRjet)
-        self.largeRjet_eta           = self.activate("f", "largeRjet_eta",          max_largeRjet)
-        self.largeRjet_e             = self.activate("f", "largeRjet_E",            max_largeRjet)
-        self.largeRjet_phi           = self.activate("f", "largeRjet_phi",          max_largeRjet)
-        self.largeRjet_mass          = self.activate("f", "largeRjet_m",            max_largeRjet)
-        self.largeRjet_truthMatched  = self.activate("f", "largeRjet_truthMatched", max_largeRjet)
-        self.largeRjet_D2            = self.activate("f", "largeRjet_D2",           max_largeRjet)
-        self.largeRjet_tau32         = self.activate("f", "largeRjet_tau32",        max_largeRjet)
-        self.largeRjet_pt_syst       = self.activate("f", "largeRjet_pt_syst",      max_largeRjet)                                                                      
-
-        self.largeRjets = [largeRjet(i, self) for i in range(0,max_largeRjet)]
-        '''
+        self.declare("largeRjet_n",            "i", "largeRjet_n")
+        self.declare("largeRjet_pt",           "f", "largeRjet_pt",           "largeRjet_n")
+        self.declare("largeRjet_eta",          "f", "largeRjet_eta",          "largeRjet_n")
+        self.declare("largeRjet_e",            "f", "largeRjet_E",            "largeRjet_n")
+        self.declare("largeRjet_phi",          "f", "largeRjet_phi",          "largeRjet_n")
+        self.declare("largeRjet_mass",         "f", "largeRjet_m",            "largeRjet_n")
+        self.declare("largeRjet_truthMatched", "f", "largeRjet_truthMatched", "largeRjet_n")
+        self.declare("largeRjet_D2",           "f", "largeRjet_D2",           "largeRjet_n")
+        self.declare("largeRjet_tau32",        "f", "largeRjet_tau32",        "largeRjet_n")
+        self.declare("largeRjet_pt_syst",      "f", "largeRjet_pt_syst",      "largeRjet_n")
+
+        self.declareCollection("largeRjets", largeRjet, "largeRjet_n", {
+            "pt"  : lambda: self.scaled("largeRjet_pt", 0.001),
+            "eta" : lambda: self.entryValues("largeRjet_eta"),
+            "phi" : lambda: self.entryValues("largeRjet_phi"),
+            "e"   : lambda: self.scaled("largeRjet_e", 0.001),
+            "m"   : lambda: self.scaled("largeRjet_mass", 0.001),
+        })
+
+    # Declaration of the branches that may be read, multiplicity names the branch holding the size of a collection
+    def declare(self, name, vartype, branchname, multiplicity = None):
+        self.Declarations[name] = (vartype, branchname, multiplicity)
+        self.BranchNames[branchname] = name
+
+    # fields lists the per object quantities that are kept in the struct of arrays of the collection (see ParticleArrays)
+    def declareCollection(self, name, particle, multiplicity, fields = None):
+        self.Collections[name] = (particle, multiplicity)
+        self.Arrays[name]      = ParticleArrays(fields or {})
+
+    # Only called for datamembers that do not exist yet, i.e. branches and collections that have not been used so far
+    def __getattr__(self, name):
+        declarations = self.__dict__.get("Declarations", {})
+        collections  = self.__dict__.get("Collections",  {})
+        if name in declarations:
+            vartype, branchname, multiplicity = declarations[name]
+            if not self.Tree.GetBranch(branchname):
+                raise RuntimeError("Branch " + branchname + " not found in the input tree")
+            maxlength = self.maxMultiplicity(multiplicity) if multiplicity else 1
+            variable  = self.activate(vartype, branchname, maxlength)
+            self.readCurrentEntry(branchname)
+        elif name in collections:
+            particle, multiplicity = collections[name]
+            variable = [particle(i, self) for i in range(0, self.maxMultiplicity(multiplicity))]
+        else:
+            raise AttributeError("TupleReader has no attribute " + name)
+        setattr(self, name, variable)
+        return variable
+
+    # Activates the branches given by name, e.g. a list of branches recorded in a previous run
+    def activateBranches(self, branchnames):
+        [getattr(self, self.BranchNames[branchname]) for branchname in branchnames if branchname in self.BranchNames]
+
+    # A branch activated in the middle of the event loop has to catch up with the entry that is currently loaded
+    def readCurrentEntry(self, branchname):
+        entry = self.Tree.GetTree().GetReadEntry() if self.Tree.GetTree() else -1
+        if entry >= 0:
+            self.Tree.GetTree().GetBranch(branchname).GetEntry(entry)
+
+    def maxMultiplicity(self, branchname):
+        if branchname not in self.Maxima:
+            entry = self.Tree.GetReadEntry()
+            self.Maxima[branchname] = min(abs(self.GetMaximum(branchname)), 20)
+            # TTree::GetMaximum reads the branch for every entry, the entry of the event loop is loaded again
+            # and the buffer of the branch, if it is activated, refilled with its value
+            if entry >= 0 and self.Tree.GetReadEntry() != entry:
+                self.Tree.LoadTree(entry)
+                self.Branches = {}
+                if branchname in self.Activated:
+                    self.readCurrentEntry(branchname)
+        return self.Maxima[branchname]
 
     def activate(self, vartype,  branchname, maxlength):
         self.Tree.SetBranchStatus(branchname,1)
+        self.Activated[branchname] = vartype
+        # only the activated branches are prefetched by the TTreeCache
+        if self.Tree.GetCacheSize() > 0:
+            self.Tree.AddBranchToCache(branchname, True)
         if (type(self.Tree.GetBranch(branchname))==ROOT.TBranchElement):
             if vartype=="f": 
                 variable = ROOT.std.vector('float')()
@@ -160,11 +270,95 @@ class TupleReader(object):
             self.Tree.SetBranchAddress( branchname, variable)
         return variable
     
-    # Used for a quick scan to get the largest value encountered in the tuple
+    # Loads an entry of the tree, the per entry values of the collections are recomputed when they are used next
+    def GetEntry(self, entry, branchnames = None):
+        """With a list of branchnames only these branches are read (staged reading), completeEntry reads the other activated branches.
+        Until then only the listed branches hold the values of the new entry."""
+        [arrays.clear() for arrays in self.Arrays.values()]
+        self.Derived.clear()
+        if branchnames is None:
+            self.Staged = None
+            return self.Tree.GetEntry(entry)
+        local = self.Tree.LoadTree(entry)
+        if local < 0: return 0
+        if self.Tree.GetTreeNumber() != self.TreeNumber:
+            # a new file of the chain was opened
+            self.Branches   = {}
+            self.TreeNumber = self.Tree.GetTreeNumber()
+        self.Staged = (local, branchnames)
+        return sum([self.branch(branchname).GetEntry(local) for branchname in branchnames])
+
+    def completeEntry(self):
+        """Reads the branches of the current entry that were skipped by a staged GetEntry."""
+        if self.Staged is None: return 0
+        local, branchnames = self.Staged
+        self.Staged = None
+        return sum([self.branch(branchname).GetEntry(local) for branchname in self.Activated if branchname not in branchnames])
+
+    def branch(self, branchname):
+        if branchname not in self.Branches:
+            self.Branches[branchname] = self.Tree.GetTree().GetBranch(branchname)
+        return self.Branches[branchname]
+
+    # Quantities derived from the event (weights, selected objects, ...) are declared once with the function computing them.
+    # They are computed at most once per entry, however often derived() is called.
+    def declareDerived(self, name, function):
+        self.Derived.Fields[name] = function
+
+    def derived(self, name):
+        return getattr(self.Derived, name)
+
+    # Values of a declared datamember for the current entry, limited to the multiplicity of the collection
+    def entryValues(self, name):
+        variable = getattr(self, name)
+        multiplicity = self.Declarations[name][2]
+        if not isinstance(variable, array):
+            return list(variable)
+        return variable[:self.multiplicity(multiplicity)] if multiplicity else variable
+
+    def scaled(self, name, scale):
+        return [value*scale for value in self.entryValues(name)]
+
+    def ratio(self, numerator, denominator):
+        return [a/b for a, b in zip(self.entryValues(numerator), self.entryValues(denominator))]
+
+    # Zero-copy numpy views of the branch buffers, e.g. self.view("Lep_pt")*0.001 for the pt of all leptons in GeV.
+    # The views share the memory of the buffers, so they only hold the values of the entry that is currently loaded.
+    def view(self, name):
+        """Returns the values of a declared datamember as a numpy array, limited to the multiplicity of the current entry for collections."""
+        variable = getattr(self, name)
+        vartype, branchname, multiplicity = self.Declarations[name]
+        if isinstance(variable, array):
+            if name not in self.Views:
+                self.Views[name] = numpy.frombuffer(variable, dtype=BatchReader.dtypes[vartype])
+            values = self.Views[name]
+        else:
+            values = vectorView(variable, vartype)
+        if multiplicity is None:
+            return values
+        return values[:self.multiplicity(multiplicity)]
+
+    def multiplicity(self, branchname):
+        """Number of objects in the current entry for the multiplicity branch of a collection."""
+        return getattr(self, self.BranchNames[branchname])[0]
+
+    # Used for a quick scan to get the largest value encountered in the tuple, taken from the metadata sidecars if available
     def GetMaximum(self,branchname):
+        if self.Metadata:
+            return max([metadata.maximum(branchname) for metadata in self.Metadata])
         self.Tree.SetBranchStatus(branchname,1)
-        return int(self.Tree.GetMaximum(branchname))
+        maximum = int(self.Tree.GetMaximum(branchname))
+        if branchname not in self.Activated:
+            self.Tree.SetBranchStatus(branchname,0)
+        return maximum
     
+    # Branches needed for the event weight of simulated events (EventInfo.scalefactor()*EventInfo.eventWeight())
+    weightBranches = ["mcWeight", "scaleFactor_PILEUP", "scaleFactor_ELE", "scaleFactor_MUON", "scaleFactor_LepTRIGGER",
+                      "scaleFactor_PHOTON", "scaleFactor_PhotonTRIGGER", "scaleFactor_TAU"]
+    # the same product as a TTreeFormula expression, evaluated in the same order
+    weightExpression = ("(scaleFactor_ELE*scaleFactor_MUON*scaleFactor_LepTRIGGER*scaleFactor_PHOTON*scaleFactor_PhotonTRIGGER*scaleFactor_TAU)"
+                        "*(mcWeight*scaleFactor_PILEUP)")
+
     # Functions to retrieve object collections (Tuplereader is called Store in the analysis code)
     def getEtMiss(self):
         return self.EtMiss
@@ -189,6 +383,50 @@ class TupleReader(object):
 
 #===========================================================
 
+class EntryCache(object):
+    """Values that are derived from the current entry, each computed by its function the first time it is used in an entry
+    and looked up afterwards. All values are dropped by TupleReader.GetEntry when the next entry is loaded.
+    """
+    def __init__(self, fields):
+        super(EntryCache, self).__init__()
+        self.Fields   = fields
+        self.Computed = []
+
+    def __getattr__(self, name):
+        fields = self.__dict__.get("Fields", {})
+        if name not in fields:
+            raise AttributeError(type(self).__name__ + " has no quantity " + name)
+        values = fields[name]()
+        setattr(self, name, values)
+        self.Computed.append(name)
+        return values
+
+    def clear(self):
+        if self.Computed:
+            [delattr(self, name) for name in self.Computed]
+            self.Computed = []
+
+class ParticleArrays(EntryCache):
+    """Struct of arrays holding the quantities of all objects of a collection in the current entry, in the units returned by
+    the particle classes (GeV) and with the relative isolations already divided out. Each quantity is computed for all
+    objects the first time it is used in an entry, later calls of the accessors only look it up.
+    """
+    pass
+
+#===========================================================
+
+def vectorView(vector, vartype):
+    """numpy view of the data of a std::vector. std::vector<bool> stores packed bits, its values have to be copied."""
+    if vartype == "b":
+        return numpy.array([bool(value) for value in vector], dtype=numpy.bool_)
+    if vector.size() == 0:
+        return numpy.zeros(0, dtype=BatchReader.dtypes[vartype])
+    data = vector.data()
+    data.reshape((vector.size(),))
+    return numpy.frombuffer(data, dtype=BatchReader.dtypes[vartype], count=vector.size())
+
+#===========================================================
+
 class EtMiss(object):
     """Missing Transverse Momentum Object.
     Missing Transverse Momentum has only two variables, its magnitude (et) and its azimuthal angle (phi).
@@ -278,10 +516,13 @@ class Lepton(object):
     the quality of the reconstruction result (isTightID), and auxillary information
     (pdgId, charge, isolation variables like isoptcone30, d0, z0...).
     """
+    __slots__ = ("idNr", "Branches", "Arrays", "_tlv")
+
     def __init__(self, idNr, branches):
         super(Lepton, self).__init__()
         self.Branches = branches
         self.idNr = idNr
+        self.Arrays = branches.Arrays["Leptons"]
         self._tlv = None
 
     def tlv(self):
@@ -295,25 +536,25 @@ class Lepton(object):
       return self.Branches.Lep_n[self.idNr]
 
     def pt(self):
-      return self.Branches.Lep_pt[self.idNr]*0.001
+      return self.Arrays.pt[self.idNr]
 
     def eta(self):
-      return self.Branches.Lep_eta[self.idNr]
+      return self.Arrays.eta[self.idNr]
 
     def phi(self):
-      return self.Branches.Lep_phi[self.idNr]
+      return self.Arrays.phi[self.idNr]
 
     def e(self):
-      return self.Branches.Lep_e[self.idNr]*0.001
+      return self.Arrays.e[self.idNr]
 
     def isTightID(self):
-        return self.Branches.Lep_isTightID[self.idNr]
+        return self.Arrays.isTightID[self.idNr]
 
     def pdgId(self):
-      return self.Branches.Lep_pdgid[self.idNr]
+      return self.Arrays.pdgId[self.idNr]
  
     def charge(self):
-      return self.Branches.Lep_charge[self.idNr]
+      return self.Arrays.charge[self.idNr]
     
     def isoptcone30(self):
       return self.Branches.Lep_ptcone30[self.idNr]                
@@ -322,10 +563,10 @@ class Lepton(object):
       return self.Branches.Lep_etcone20[self.idNr]                
 
     def isoptconerel30(self):
-      return self.Branches.Lep_ptcone30[self.idNr]/self.Branches.Lep_pt[self.idNr]                
+      return self.Arrays.isoptconerel30[self.idNr]
 
     def isoetconerel20(self):
-      return self.Branches.Lep_etcone20[self.idNr]/self.Branches.Lep_pt[self.idNr]
+      return self.Arrays.isoetconerel20[self.idNr]
 
     def d0(self):
       return self.Branches.Lep_d0[self.idNr]
@@ -372,10 +613,13 @@ class Jet(object):
     auxillary information (mv2c10, jvt). Truth information regarding the flavour of the quark they com from (truepdgid)
     and whether they were matched to a true jet (isTrueJet) is available.
     """
+    __slots__ = ("idNr", "Branches", "Arrays", "_tlv")
+
     def __init__(self, idNr, branches):
         super(Jet, self).__init__()
         self.idNr = idNr
         self.Branches = branches
+        self.Arrays = branches.Arrays["Jets"]
         self._tlv = None
 
     def tlv(self):
@@ -389,16 +633,16 @@ class Jet(object):
       return self.Branches.Jet_n[self.idNr]
     
     def pt(self):
-      return self.Branches.Jet_pt[self.idNr]*0.001
+      return self.Arrays.pt[self.idNr]
 
     def eta(self):
-      return self.Branches.Jet_eta[self.idNr]
+      return self.Arrays.eta[self.idNr]
     
     def phi(self):
-      return self.Branches.Jet_phi[self.idNr]
+      return self.Arrays.phi[self.idNr]
     
     def e(self):
-      return self.Branches.Jet_e[self.idNr]*0.001
+      return self.Arrays.e[self.idNr]
     
     def m(self):
       return self.tlv().M() 
@@ -407,7 +651,7 @@ class Jet(object):
       return self.Branches.Jet_mv2c10[self.idNr] 
       
     def jvt(self):
-      return self.Branches.Jet_jvt[self.idNr]
+      return self.Arrays.jvt[self.idNr]
 
     def truepdgid(self):
       return self.Branches.Jet_trueflav[self.idNr]
@@ -430,10 +674,13 @@ class Photon(object):
     the quality of the reconstruction result (isTightID), and auxillary information                                                          
     (isolation variables like isoptcone30...).                                                                      
     """
+    __slots__ = ("idNr", "Branches", "Arrays", "_tlv")
+
     def __init__(self, idNr, branches):
         super(Photon, self).__init__()
         self.Branches = branches
         self.idNr = idNr
+        self.Arrays = branches.Arrays["Photons"]
         self._tlv = None
 
     def tlv(self):
@@ -453,19 +700,19 @@ class Photon(object):
       return self.Branches.Photon_trigMatch[self.idNr]
 
     def pt(self):
-      return self.Branches.Photon_pt[self.idNr]*0.001
+      return self.Arrays.pt[self.idNr]
 
     def eta(self):
-      return self.Branches.Photon_eta[self.idNr]
+      return self.Arrays.eta[self.idNr]
 
     def phi(self):
-      return self.Branches.Photon_phi[self.idNr]
+      return self.Arrays.phi[self.idNr]
 
     def e(self):
-      return self.Branches.Photon_e[self.idNr]*0.001
+      return self.Arrays.e[self.idNr]
 
     def isTightID(self):
-      return self.Branches.Photon_isTightID[self.idNr]
+      return self.Arrays.isTightID[self.idNr]
 
     def isoptcone30(self):
       return self.Branches.Photon_ptcone30[self.idNr]
@@ -474,10 +721,10 @@ class Photon(object):
       return self.Branches.Photon_etcone20[self.idNr]
 
     def isoptconerel30(self):
-      return self.Branches.Photon_ptcone30[self.idNr]/self.Branches.Photon_pt[self.idNr]
+      return self.Arrays.isoptconerel30[self.idNr]
 
     def isoetconerel20(self):
-      return self.Branches.Photon_etcone20[self.idNr]/self.Branches.Photon_pt[self.idNr]
+      return self.Arrays.isoetconerel20[self.idNr]
 
     def convType(self):
       return self.Branches.Photon_convType[self.idNr]
@@ -513,10 +760,13 @@ class Tau(object):
     the quality of the reconstruction result (isTightID), and                             
     auxillary information (charge, number of tracks, boosted decision tree score for identification).
     """
+    __slots__ = ("idNr", "Branches", "Arrays", "_tlv")
+
     def __init__(self, idNr, branches):
         super(Tau, self).__init__()
         self.idNr = idNr
         self.Branches = branches
+        self.Arrays = branches.Arrays["Taus"]
         self._tlv = None
 
     def tlv(self):
@@ -530,19 +780,19 @@ class Tau(object):
       return self.Branches.Tau_n[self.idNr]
 
     def pt(self):
-      return self.Branches.Tau_pt[self.idNr]*0.001
+      return self.Arrays.pt[self.idNr]
 
     def eta(self):
-      return self.Branches.Tau_eta[self.idNr]
+      return self.Arrays.eta[self.idNr]
 
     def phi(self):
-      return self.Branches.Tau_phi[self.idNr]
+      return self.Arrays.phi[self.idNr]
 
     def e(self):
-      return self.Branches.Tau_e[self.idNr]*0.001
+      return self.Arrays.e[self.idNr]
 
     def isTightID(self):
-      return self.Branches.Tau_isTightID[self.idNr]
+      return self.Arrays.isTightID[self.idNr]
 
     def isTruthMatched(self):
       return self.Branches.Tau_truthMatch[self.idNr]
@@ -557,7 +807,7 @@ class Tau(object):
       return self.Branches.Tau_BDTid[self.idNr]
 
     def charge(self):
-      return self.Branches.Tau_charge[self.idNr]
+      return self.Arrays.charge[self.idNr]
 
     def DiTau_m(self):
       return self.Branches.DiTau_m[0]
@@ -576,10 +826,13 @@ class largeRjet(object):
     """Large-radius Jet objects have accessors regarding their kinematic information (pt, eta, phi, e), their properties (m), and                             
     auxillary information (D2, tau32). Truth information whether they were matched to a true large-radius jet (isTrueLargeRjet) is available.                                                                        
     """
+    __slots__ = ("idNr", "Branches", "Arrays", "_tlv")
+
     def __init__(self, idNr, branches):
         super(largeRjet, self).__init__()
         self.idNr = idNr
         self.Branches = branches
+        self.Arrays = branches.Arrays["largeRjets"]
         self._tlv = None
 
     def tlv(self):
@@ -593,19 +846,19 @@ class largeRjet(object):
       return self.Branches.largeRjet_n[self.idNr]
 
     def pt(self):
-      return self.Branches.largeRjet_pt[self.idNr]*0.001
+      return self.Arrays.pt[self.idNr]
 
     def eta(self):
-      return self.Branches.largeRjet_eta[self.idNr]
+      return self.Arrays.eta[self.idNr]
 
     def phi(self):
-      return self.Branches.largeRjet_phi[self.idNr]
+      return self.Arrays.phi[self.idNr]
 
     def e(self):
-      return self.Branches.largeRjet_e[self.idNr]*0.001
+      return self.Arrays.e[self.idNr]
 
     def m(self):
-      return self.Branches.largeRjet_mass[self.idNr]*0.001
+      return self.Arrays.m[self.idNr]
 
     def isTrueLargeRjet(self):
       return self.Branches.largeRjet_truthMatched[self.idNr]
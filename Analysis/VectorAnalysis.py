@@ -0,0 +1,53 @@
+import ROOT
+import numpy
+
+from Analysis import Analysis
+
+#======================================================================
+
+class VectorAnalysis(Analysis.Analysis):
+    """Baseclass for analyses that process whole batches of events at once instead of single events.
+    Analyses deriving from this class implement analyzeBatch, which receives a Batch of numpy arrays
+    (see BatchReader.py) and returns a boolean mask of the events passing the selection.
+    Cuts are expressed as masks, the event counter is fed with the weights of the surviving events
+    and histograms are filled from arrays.
+    """
+
+    def __init__(self, auxName):
+        super(VectorAnalysis, self).__init__(auxName)
+
+    #Execution functions
+    def doAnalysisBatch(self, batch):
+        weights = self.getWeights(batch)
+        if not self.PreCounted:
+            self.countEvent("all", weights)
+        preselected = self.preselectBatch(batch)
+        passed = self.analyzeBatch(batch)
+        self.countEvent("final", weights[passed])
+        return preselected
+
+    # Mask of the events passing a loose selection, these events are kept in skims
+    def preselectBatch(self, batch):
+        return numpy.ones(batch.Size, dtype=bool)
+
+    def analyzeBatch(self, batch):
+        return numpy.ones(batch.Size, dtype=bool)
+
+    # Event weights of the batch, computed in the same order as EventInfo.scalefactor()*EventInfo.eventWeight()
+    def getWeights(self, batch):
+        if "weight" not in batch.Derived:
+            if self.getIsData():
+                batch.Derived["weight"] = numpy.ones(batch.Size)
+            else:
+                column = lambda name: batch[name].astype(numpy.float64)
+                scalefactor = column("scaleFactor_ELE")*column("scaleFactor_MUON")*column("scaleFactor_LepTRIGGER")*column("scaleFactor_PHOTON")*column("scaleFactor_PhotonTRIGGER")*column("scaleFactor_TAU")
+                eventWeight = column("mcWeight")*column("scaleFactor_PILEUP")
+                batch.Derived["weight"] = scalefactor*eventWeight
+        return batch.Derived["weight"]
+
+    #Forwarding functions
+    def countEvent(self, cut, weights):
+        self.EventCounter.updateBatch(cut, weights)
+
+    def fillHistogram(self, histogram, values, weights):
+        self.HistManager.fillArray(histogram, values, weights)
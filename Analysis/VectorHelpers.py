@@ -0,0 +1,71 @@
+import numpy
+
+"""Array versions of the helper functions in AnalysisHelpers for analyses working on batches (see VectorAnalysis.py).
+The Object Selection Helpers return one boolean per object of a collection in a Batch, i.e. a mask with the layout
+of the flat collection branches (lep_pt, jet_eta, ...). They apply exactly the same cuts as their counterparts in
+AnalysisHelpers, which remain the reference implementation, and compute the quantities in double precision like the
+particle classes of the TupleReader do.
+The selectAndSortContainer function selects the objects of a mask and orders them by decreasing value of a key within
+every event, returning the indices of the selected objects together with the offsets delimiting the events.
+"""
+
+# Quantities of the particle classes
+def column(batch, branchname, scale = 1):
+    values = batch[branchname].astype(numpy.float64)
+    return values*scale if scale != 1 else values
+
+def pt(batch, prefix):
+    return column(batch, prefix + "_pt", 0.001)
+
+def isoptconerel30(batch, prefix):
+    return column(batch, prefix + "_ptcone30")/column(batch, prefix + "_pt")
+
+def isoetconerel20(batch, prefix):
+    return column(batch, prefix + "_etcone20")/column(batch, prefix + "_pt")
+
+# Object Selection Helpers
+def isGoodPhoton(batch):
+    return batch["photon_isTightID"].astype(bool) & (pt(batch, "photon") > 25) & (isoetconerel20(batch, "photon") < 0.15) & (isoptconerel30(batch, "photon") < 0.15)
+
+def isGoodLepton(batch):
+    flavour = numpy.abs(batch["lep_type"])
+    return ((flavour == 11) & isGoodElectron(batch)) | ((flavour == 13) & isGoodMuon(batch))
+
+def isGoodElectron(batch):
+    return batch["lep_isTightID"].astype(bool) & (pt(batch, "lep") > 25) & (isoetconerel20(batch, "lep") < 0.15) & (isoptconerel30(batch, "lep") < 0.15)
+
+def isGoodMuon(batch):
+    return batch["lep_isTightID"].astype(bool) & (pt(batch, "lep") > 25) & (isoetconerel20(batch, "lep") < 0.15) & (isoptconerel30(batch, "lep") < 0.15)
+
+def isGoodJet(batch):
+    jetPt, jetEta = pt(batch, "jet"), numpy.abs(column(batch, "jet_eta"))
+    return ~(jetPt < 25) & ~(jetEta > 2.5) & ~((jetPt < 60) & (jetEta < 2.4) & (column(batch, "jet_jvt") < 0.59))
+
+def isGoodFatJet(batch):
+    return ~(pt(batch, "largeRjet") < 250) & ~(numpy.abs(column(batch, "largeRjet_eta")) > 2) & ~(column(batch, "largeRjet_m", 0.001) < 40)
+
+def isGoodTau(batch):
+    return ~(pt(batch, "tau") < 25) & ~(numpy.abs(column(batch, "tau_eta")) > 2.5) & batch["tau_isTightID"].astype(bool)
+
+# Utility functions
+def selectAndSortContainer(batch, branchname, mask, key):
+    """Selects the objects of the collection of branchname passing mask and sorts them within every event by
+    decreasing key (an array with the layout of the collection). Objects with equal keys keep their order, as with sorted().
+    Returns the flat indices of the selected objects and the offsets delimiting the events, the objects of event i are
+    indices[offsets[i]:offsets[i+1]]."""
+    selected = numpy.flatnonzero(mask)
+    event    = batch.eventIndex(branchname)[selected]
+    order    = numpy.lexsort((-key[selected], event))
+    counts   = numpy.bincount(event, minlength=batch.Size)
+    return selected[order], numpy.concatenate(([0], numpy.cumsum(counts)))
+
+def countPerEvent(offsets):
+    return numpy.diff(offsets)
+
+def objectAt(indices, offsets, position, fill = -1):
+    """Index of the object at the given position (0 = leading) in every event, fill for events with fewer objects."""
+    counts = numpy.diff(offsets)
+    result = numpy.full(len(counts), fill, dtype=numpy.int64)
+    has    = counts > position
+    result[has] = indices[offsets[:-1][has] + position]
+    return result
@@ -9,6 +9,7 @@ import ROOT
 from collections import OrderedDict
 
 from . import infofile
+from Analysis import EventCounter
 
 config      = dict()
 histoptions = OrderedDict()
@@ -40,5 +41,19 @@ def getHistogram(subcontribution, doScaling):
       hist.Scale(getScaleFactor(subcontribution))
     if "rebin" in histoptions: hist.Rebin(histoptions["rebin"])
     return hist    
-    
-    
+
+def getCutflow(subcontribution, doScaling, raw = False):
+    """Cutflow written by the EventCounter of the analysis job, one labelled bin per cut.
+    The weighted cutflow is scaled like the histograms, the raw one holds the number of events.
+    Returns None for outputs written before the cutflow was stored."""
+    if subcontribution not in rootFiles:
+      rootFiles[subcontribution] = ROOT.TFile.Open( "%s/%s.root" % (config["InputDirectory"], subcontribution), "READ")
+    name = EventCounter.rawCutflowName if raw else EventCounter.cutflowName
+    hist = rootFiles[subcontribution].Get(name)
+    if not hist:
+      print("No %s found in the output of %s, it has to be produced again to hold the cutflow" % (name, subcontribution))
+      return None
+    hist = hist.Clone()
+    if doScaling and not raw:
+      hist.Scale(getScaleFactor(subcontribution))
+    return hist
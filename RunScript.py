@@ -1,4 +1,5 @@
 import argparse
+import collections
 import sys
 import os
 import glob
@@ -6,7 +7,12 @@ import ROOT
 import importlib
 from Analysis import Job as Job
 from Analysis import Disclaimer as DC
-from multiprocessing import Pool 
+from Analysis import FileCache
+from Analysis import FileMetadata
+from Analysis import OutputMerger
+from Analysis import DeclarativeAnalysis
+from Analysis import ResultCache
+from multiprocessing import Pool, TimeoutError, cpu_count
 
 def buildProcessingDict(configuration, samples):
     if samples == "": 
@@ -28,19 +34,97 @@ def checkAnalysis(configuration, analysisOption):
     except ImportError:
         print("Error when trying to read the analysis code for %s. Please check name validity" % analysisName)
         sys.exit(1)
+    return getattr(importedAnalysisModule, analysisName)
 
 def BuildJob(configuration, processName, fileLocation):
     job = Job.Job(processName, configuration, fileLocation )
     return job
 
 
+def BuildShards(configuration, processName, fileLocation, nShards):
+    """Splits the events of a sample into nShards consecutive entry ranges, each processed by its own job."""
+    if nShards <= 1:
+        return [BuildJob(configuration, processName, fileLocation)]
+    # the same sidecar as the one of the jobs, which read remote files from the file cache
+    metadata = FileMetadata.FileMetadata(fileLocation, os.path.join(configuration.get("CacheDirectory", "Cache/"), "metadata"), fileIdentity(fileLocation))
+    nEvents  = Job.eventsToProcess(metadata.entries(), configuration)
+    metadata.close()
+    bounds = [nEvents*i//nShards for i in range(nShards + 1)]
+    return [Job.Job(processName, configuration, fileLocation, (bounds[i], bounds[i+1]), i) for i in range(nShards)]
+
+def NumberOfShards(processingDict, nWorkers, split):
+    """Number of shards per sample: given by the split option or, if it is not set, chosen such that
+    the largest sample is spread over all workers and the other samples proportionally to their size."""
+    if split > 0:
+        return dict((processName, split) for processName in processingDict)
+    sizes   = dict((processName, fileSize(fileLocation)) for processName, fileLocation in processingDict.items())
+    largest = max(sizes.values())
+    return dict((processName, max(1, int(round(nWorkers*size/float(largest))))) for processName, size in sizes.items())
+
+def MergeShards(jobs, processName, merger):
+    """Starts merging the partial outputs of the shards of a sample into <OutputDirectory>/<process>.root on the pool of
+    the merger, while the pool goes on with the other jobs."""
+    output = jobs[0].Configuration["OutputDirectory"] + processName + ".root"
+    parts  = [job.OutputFileLocation + ".root" for job in jobs if job.Name == processName]
+    merger.add(output, parts)
+
+def NextResult(results, merger):
+    """Waits for the next finished job, the merging of the samples that are done goes on meanwhile."""
+    while True:
+        try:
+            return results.next(timeout=1)
+        except TimeoutError:
+            merger.poll()
+
+# identities of the input files, remote files are only asked once
+fileIdentities = {}
+
+def fileIdentity(location):
+    if location not in fileIdentities:
+        fileIdentities[location] = FileMetadata.fileIdentity(location)
+    return fileIdentities[location]
+
+def fileSize(location):
+    return fileIdentity(location)["size"]
+
+def ResultKeys(configuration, processingDict):
+    return dict((processName, ResultCache.resultKey(configuration, fileIdentity(fileLocation))) for processName, fileLocation in processingDict.items())
+
+def OutdatedSamples(configuration, processingDict, resultKeys):
+    """Samples whose output was not produced with the current analysis code, configuration and input file.
+    With the Skim setting a sample whose skim is missing is processed again as well."""
+    outdated = {}
+    for processName, fileLocation in processingDict.items():
+        skimMissing = configuration.get("Skim", "") and not os.path.exists(os.path.join(configuration["Skim"], processName + ".root"))
+        if not skimMissing and ResultCache.storedKey(configuration["OutputDirectory"] + processName + ".root") == resultKeys[processName]:
+            print("Output of %s is up to date, it is not processed again" % processName)
+        else:
+            outdated[processName] = fileLocation
+    return outdated
+
+def StampResults(configuration, processNames, resultKeys):
+    [ResultCache.stamp(configuration["OutputDirectory"] + processName + ".root", resultKeys[processName]) for processName in processNames]
+
 def SortJobsBySize(jobs):  
     def jobSize(job):
-        return sum([os.lstat(f).st_size for f in job.InputFiles])
+        return sum([fileSize(f) for f in job.InputFiles])
     return sorted(jobs, key=jobSize, reverse=True)
 
+def StartPrefetching(configuration, jobs):
+    """Downloads the input files of the jobs into the file cache in the background, in the order the jobs will be run."""
+    if not configuration.get("FileCache", False): return None
+    ROOT.EnableThreadSafety()
+    fileCache = FileCache.FileCache(os.path.join(configuration.get("CacheDirectory", "Cache/"), "files"),
+                                    float(configuration.get("FileCacheLimit", 50e9)), configuration.get("VerifyChecksum", False))
+    # the shards of a sample share its file, which is prefetched once
+    locations  = list(collections.OrderedDict.fromkeys([f for job in jobs for f in job.InputFiles]))
+    prefetcher = FileCache.Prefetcher(fileCache, locations, float(configuration.get("PrefetchLimit", 10e9)))
+    prefetcher.start()
+    return prefetcher
+
 def RunJob(job):
     job.run()
+    return job.Name, job.InputFiles, job.Analysis.EventCounter
 
  
 #======================================================================
@@ -58,6 +142,7 @@ def main( argv ):
     parser.add_argument('-a', '--analysis',   default=""                               , type=str,   help='overrides the analysis specified in configuration file')
     parser.add_argument('-s', '--samples',    default=""                               , type=str,   help='string with comma separated list of samples to analyse')
     parser.add_argument('-o', '--output',     default=""                               , type=str,   help='name of the output directory')
+    parser.add_argument('-x', '--split',      default=0,                                 type=int,   help='number of entry ranges each sample is split into in parallel mode (default: chosen from the number of workers)')
     args = parser.parse_args()
     
     configModuleName = args.configfile.replace("/", ".").replace(".py","")
@@ -67,19 +152,59 @@ def main( argv ):
     if not os.path.exists(configuration.Job["OutputDirectory"]):
         os.makedirs(configuration.Job["OutputDirectory"])
 
-    checkAnalysis(configuration, args.analysis)
+    analysisClass = checkAnalysis(configuration, args.analysis)
     processingDict = buildProcessingDict(configuration, args.samples)
 
+    resultKeys = {}
+    if configuration.Job.get("ResultCache", False):
+        resultKeys = ResultKeys(configuration.Job, processingDict)
+        processingDict = OutdatedSamples(configuration.Job, processingDict, resultKeys)
+        if not processingDict:
+            print("All outputs are up to date")
+            return
+
     if (args.parallel):
         configuration.Job["Batch"] = True
-        jobs = [BuildJob(configuration.Job, processName, fileLocation) for processName, fileLocation in processingDict.items()]
+        if issubclass(analysisClass, DeclarativeAnalysis.DeclarativeAnalysis):
+            # data frame jobs are multithreaded themselves, the samples are not split and the cores shared among the workers
+            configuration.Job.setdefault("Threads", max(1, cpu_count()//args.nWorkers))
+            shards = dict((processName, 1) for processName in processingDict)
+        elif configuration.Job.get("Skim", ""):
+            # a skim is written per job, the samples are not split so every sample gives a single skim file
+            shards = dict((processName, 1) for processName in processingDict)
+        else:
+            shards = NumberOfShards(processingDict, args.nWorkers, args.split)
+        jobs = [job for processName, fileLocation in processingDict.items() for job in BuildShards(configuration.Job, processName, fileLocation, shards[processName])]
         jobs = SortJobsBySize(jobs)
         pool = Pool(processes=args.nWorkers)              # start with n worker processes
-        pool.map(RunJob, jobs, chunksize=1)
+        prefetcher = StartPrefetching(configuration.Job, jobs)
+        eventCounters = {}
+        merger        = OutputMerger.OutputMerger(pool)
+        results       = pool.imap_unordered(RunJob, jobs, chunksize=1)
+        for n in range(len(jobs)):
+            processName, inputFiles, eventCounter = NextResult(results, merger)
+            merger.poll()
+            eventCounters.setdefault(processName, []).append(eventCounter)
+            if len(eventCounters[processName]) < shards[processName]: continue
+            # all shards of the sample are done, their outputs are merged while the remaining jobs run
+            if prefetcher: prefetcher.release(inputFiles)
+            if shards[processName] > 1:
+                MergeShards(jobs, processName, merger)
+                OutputMerger.mergeCounters(eventCounters[processName]).printResults()
+        merger.wait()
+        if resultKeys:
+            StampResults(configuration.Job, processingDict, resultKeys)
+        pool.close()
+        pool.join()
 
     else:
-        for processName, fileLocation in processingDict.items():
-            RunJob(BuildJob(configuration.Job, processName, fileLocation))      
+        jobs = [BuildJob(configuration.Job, processName, fileLocation) for processName, fileLocation in processingDict.items()]
+        prefetcher = StartPrefetching(configuration.Job, jobs)
+        for job in jobs:
+            processName, inputFiles, eventCounter = RunJob(job)
+            if prefetcher: prefetcher.release(inputFiles)
+            if resultKeys:
+                StampResults(configuration.Job, [processName], resultKeys)
   
 #======================================================================   
 if __name__ == "__main__":